@@ -0,0 +1,159 @@
+"""Сборка статики: имена с хэшем содержимого, заранее сжатые копии и манифест для шаблонов.
+
+Собранные файлы лежат в app/static/build и отдаются с Cache-Control: immutable — повторный визит
+не скачивает статику вовсе, а новая версия файла получает новое имя. Сборка идет при старте приложения
+(ASSETS_BUILD_ON_STARTUP) или заранее, при сборке образа:
+    python -m app.assets
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Tuple
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = "app/static"
+STATIC_URL = "/static/"
+BUILD_DIR = "build"
+MANIFEST = "manifest.json"
+# Сжимаем только текст; совсем маленькие файлы сжатие почти не уменьшает
+COMPRESSIBLE = {".css", ".js", ".json", ".map", ".svg", ".txt", ".html"}
+MIN_COMPRESS_BYTES = 512
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+Manifest = Dict[str, str]
+Encodings = Dict[str, List[str]]
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Воркеры собирают одновременно: у каждого свой временный файл, публикация — rename
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _compress(data: bytes) -> Dict[str, bytes]:
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def build_assets(directory: str = STATIC_DIR) -> Tuple[Manifest, Encodings]:
+    """Собрать все файлы directory в directory/build; вернуть манифест и доступные сжатые варианты.
+
+    Имя собранного файла зависит только от содержимого, поэтому уже собранное не переписывается,
+    а прошлые версии остаются на месте для страниц, открытых до деплоя.
+    """
+    build_dir = os.path.join(directory, BUILD_DIR)
+    manifest: Manifest = {}
+    encodings: Encodings = {}
+    for root, dirs, files in os.walk(directory):
+        if os.path.abspath(root) == os.path.abspath(directory) and BUILD_DIR in dirs:
+            dirs.remove(BUILD_DIR)
+        for name in files:
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, directory).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            stem, ext = os.path.splitext(path)
+            built = f"{BUILD_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+            target = os.path.join(directory, built)
+            if not os.path.exists(target):
+                _write_atomic(target, data)
+            manifest[path] = built
+            encodings[built] = []
+            if ext in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+                for encoding, body in _compress(data).items():
+                    if not os.path.exists(target + ENCODING_SUFFIXES[encoding]):
+                        _write_atomic(target + ENCODING_SUFFIXES[encoding], body)
+                    encodings[built].append(encoding)
+
+    _write_atomic(os.path.join(build_dir, MANIFEST),
+                  json.dumps({"assets": manifest, "encodings": encodings}, indent=1, sort_keys=True).encode())
+    return manifest, encodings
+
+
+def accepted_encodings(scope: Scope) -> List[str]:
+    """Кодировки из Accept-Encoding запроса, кроме явно запрещенных через q=0"""
+    header = ""
+    for key, value in scope["headers"]:
+        if key == b"accept-encoding":
+            header = value.decode("latin-1")
+            break
+    accepted = []
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.append(coding.strip().lower())
+    return accepted
+
+
+class StaticAssets(StaticFiles):
+    """/static: собранные файлы — immutable и в сжатом варианте по Accept-Encoding, остальное — с перепроверкой.
+
+    Ответы на собранные файлы варьируются по Accept-Encoding: br, если его принимает клиент, потом gzip.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR):
+        super().__init__(directory=directory)
+        self.manifest: Manifest = {}
+        self.encodings: Encodings = {}
+
+    def build(self):
+        self.manifest, self.encodings = build_assets(self.directory)
+        logging.info(f"Built {len(self.manifest)} static asset(s)")
+
+    def load(self):
+        """Подхватить манифест, собранный заранее через python -m app.assets"""
+        try:
+            with open(os.path.join(self.directory, BUILD_DIR, MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            logging.warning("Static assets are not built, serving source files without long-term caching")
+            return
+        self.manifest, self.encodings = manifest["assets"], manifest["encodings"]
+
+    def url(self, path: str) -> str:
+        """URL файла из app/static для шаблонов: собранное имя с хэшем, а без сборки — исходный файл"""
+        return STATIC_URL + self.manifest.get(path, path)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        path = path.replace(os.sep, "/")
+        encodings = self.encodings.get(path)
+        if encodings is None:
+            response = await super().get_response(path, scope)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        accepted = accepted_encodings(scope)
+        encoding = next((encoding for encoding in ("br", "gzip") if encoding in encodings and encoding in accepted),
+                        None)
+        response = await super().get_response(path + ENCODING_SUFFIXES[encoding] if encoding else path, scope)
+        # Content-Type сжатого варианта FileResponse берет по исходному расширению (a.js.br -> text/javascript)
+        if encoding and response.status_code == 200:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+static_assets = StaticAssets()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    static_assets.build()
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import os
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.metrics import FunctionCounter, Gauge
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx.json"
+# zlib с этим wbits пишет и читает полноценный gzip-member
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+# Ключ порядка истории — тот же, что у keyset-пагинации в БД
+Key = Tuple[datetime, int]
+
+
+class ArchivedMessage:
+    """Сообщение из архивного сегмента: те же поля, что у Message, которые нужны для ответа API"""
+    __slots__ = ('id', 'chat_id', 'sender_id', 'content', 'created_at', 'sender', 'seq')
+
+    def __init__(self, chat_id: int, created_at: datetime, id: int, sender_id: int, content: str):
+        self.id = id
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.content = content
+        self.created_at = created_at
+        self.sender = None
+        # Архив не хранит seq сообщений — только наибольший на чат (MessageArchive.archived_seq)
+        self.seq = None
+
+
+class _Block:
+    __slots__ = ('segment', 'offset', 'length', 'count', 'first', 'last', 'min_id', 'max_id')
+
+    def __init__(self, segment: str, offset: int, length: int, count: int, first: Key, last: Key,
+                 min_id: int, max_id: int):
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.count = count
+        self.first = first
+        self.last = last
+        self.min_id = min_id
+        self.max_id = max_id
+
+
+def _key(value: list) -> Key:
+    return datetime.fromisoformat(value[0]), value[1]
+
+
+class SegmentWriter:
+    """Запись одной партиции в сегмент: строки подаются по (chat_id, created_at, id).
+
+    Сообщения чата пишутся gzip-блоками по block_messages штук — каждый блок отдельный gzip-member,
+    который читается сам по себе по смещению из индекса. Сегмент и индекс появляются в каталоге
+    атомарно (rename) и после этого не меняются.
+    """
+
+    def __init__(self, directory: str, name: str, block_messages: int):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        self.index_path = os.path.join(directory, name + INDEX_SUFFIX)
+        self.block_messages = block_messages
+        self.count = 0
+        self._file = open(self.path + ".tmp", "wb")
+        self._chats: Dict[str, List[dict]] = {}
+        self._seqs: Dict[str, int] = {}
+        self._chat_id: Optional[int] = None
+        self._block: Optional[dict] = None
+        self._compressor = None
+
+    def add(self, chat_id: int, message_id: int, sender_id: int, content: str, created_at: datetime,
+            seq: Optional[int] = None):
+        if self._block is None or chat_id != self._chat_id or self._block["count"] >= self.block_messages:
+            self._finish_block()
+            self._chat_id = chat_id
+            self._block = {"offset": self._file.tell(), "length": 0, "count": 0, "first": None, "last": None,
+                           "min_id": message_id, "max_id": message_id}
+            self._chats.setdefault(str(chat_id), []).append(self._block)
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS)
+        created_at = created_at.isoformat()
+        line = json.dumps([created_at, message_id, sender_id, content], ensure_ascii=False).encode() + b"\n"
+        self._file.write(self._compressor.compress(line))
+        block = self._block
+        block["count"] += 1
+        block["first"] = block["first"] or [created_at, message_id]
+        block["last"] = [created_at, message_id]
+        block["min_id"] = min(block["min_id"], message_id)
+        block["max_id"] = max(block["max_id"], message_id)
+        self.count += 1
+        self.cover_seq(chat_id, seq)
+
+    def cover_seq(self, chat_id: int, seq: Optional[int]):
+        """Событие чата с этим seq касается сообщения сегмента: без архива его не дослать"""
+        if seq is not None and seq > self._seqs.get(str(chat_id), 0):
+            self._seqs[str(chat_id)] = seq
+
+    @property
+    def chat_ids(self) -> List[int]:
+        return [int(chat_id) for chat_id in self._chats]
+
+    def _finish_block(self):
+        if self._block is None:
+            return
+        self._file.write(self._compressor.flush())
+        self._block["length"] = self._file.tell() - self._block["offset"]
+        self._block = None
+
+    def close(self, range_start: datetime, range_end: datetime):
+        """Дописать сегмент и индекс на диск и атомарно опубликовать их"""
+        self._finish_block()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+        index = {
+            "version": 1,
+            "segment": os.path.basename(self.path),
+            "range": [range_start.isoformat(), range_end.isoformat()],
+            "messages": self.count,
+            "chats": self._chats,
+            "seqs": self._seqs,
+        }
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        # Индекс публикуется последним: сегмент без индекса читатели не видят
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def abort(self):
+        """Удалить недописанный сегмент; после close ничего не делает"""
+        if self._file.closed:
+            return
+        self._file.close()
+        os.remove(self.path + ".tmp")
+
+
+class MessageArchive:
+    """Чтение истории из сегментов архива.
+
+    Индексы всех сегментов держатся в памяти (chat_id -> блоки по порядку истории) и перечитываются,
+    когда меняется каталог. Для чатов без архива запросы не трогают диск; распакованные блоки
+    кэшируются по LRU, сама распаковка идет в пуле потоков.
+    """
+
+    def __init__(self, directory: str, block_messages: int, cache_blocks: int):
+        self.directory = directory
+        self.block_messages = block_messages
+        self.cache_blocks = cache_blocks
+        self._mtime: Optional[int] = None
+        self._chats: Dict[int, List[_Block]] = {}
+        self._seqs: Dict[int, int] = {}
+        self._segments = 0
+        self._cache: "OrderedDict[Tuple[str, int], list]" = OrderedDict()
+        self.block_reads = 0
+
+    def writer(self, name: str) -> SegmentWriter:
+        return SegmentWriter(self.directory, name, self.block_messages)
+
+    def has_chat(self, chat_id: int) -> bool:
+        self._refresh()
+        return chat_id in self._chats
+
+    def archived_seq(self, chat_id: int) -> int:
+        """Наибольший seq события чата, которое касается архивных сообщений; 0 — таких нет.
+
+        События до него включительно из БД не восстановить: сообщений там уже нет.
+        """
+        self._refresh()
+        return self._seqs.get(chat_id, 0)
+
+    async def find_key(self, chat_id: int, message_id: int) -> Optional[Key]:
+        """Ключ (created_at, id) архивного сообщения чата или None, если его нет в архиве"""
+        for block in self._chats.get(chat_id, ()):
+            if block.min_id <= message_id <= block.max_id:
+                for row in await self._read_block(block):
+                    if row[1] == message_id:
+                        return row[0], row[1]
+        return None
+
+    async def read(self, chat_id: int, before: Key = None, after: Key = None,
+                   limit: int = None) -> List[ArchivedMessage]:
+        """Сообщения чата строго между after и before по возрастанию (created_at, id).
+
+        С limit — limit самых новых, а если задан after — limit самых старых после него.
+        """
+        newest = after is None
+        blocks = self._chats.get(chat_id, [])
+        selected: List[tuple] = []
+        for block in reversed(blocks) if newest else blocks:
+            if (before is not None and block.first >= before) or (after is not None and block.last <= after):
+                continue
+            rows = [row for row in await self._read_block(block)
+                    if (before is None or row[:2] < before) and (after is None or row[:2] > after)]
+            selected = rows + selected if newest else selected + rows
+            if limit is not None and len(selected) >= limit:
+                break
+        if limit is not None:
+            selected = selected[-limit:] if newest else selected[:limit]
+        return [ArchivedMessage(chat_id, *row) for row in selected]
+
+    async def _read_block(self, block: _Block) -> list:
+        cache_key = (block.segment, block.offset)
+        rows = self._cache.get(cache_key)
+        if rows is not None:
+            self._cache.move_to_end(cache_key)
+            return rows
+        rows = await asyncio.to_thread(self._decode, block)
+        self.block_reads += 1
+        self._cache[cache_key] = rows
+        while len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return rows
+
+    def _decode(self, block: _Block) -> list:
+        with open(os.path.join(self.directory, block.segment), "rb") as f:
+            f.seek(block.offset)
+            data = zlib.decompress(f.read(block.length), GZIP_WBITS)
+        rows = []
+        for line in data.splitlines():
+            created_at, message_id, sender_id, content = json.loads(line)
+            rows.append((datetime.fromisoformat(created_at), message_id, sender_id, content))
+        return rows
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+
+        chats: Dict[int, List[_Block]] = {}
+        seqs: Dict[int, int] = {}
+        segments = 0
+        names = sorted(os.listdir(self.directory)) if mtime is not None else []
+        for name in names:
+            if not name.endswith(INDEX_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    index = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Skipping unreadable archive index {name}: {e}")
+                continue
+            segments += 1
+            for chat_id, blocks in index["chats"].items():
+                chats.setdefault(int(chat_id), []).extend(
+                    _Block(index["segment"], block["offset"], block["length"], block["count"], _key(block["first"]),
+                           _key(block["last"]), block["min_id"], block["max_id"])
+                    for block in blocks
+                )
+            for chat_id, seq in index.get("seqs", {}).items():
+                seqs[int(chat_id)] = max(seqs.get(int(chat_id), 0), seq)
+        for blocks in chats.values():
+            blocks.sort(key=lambda block: block.first)
+        self._chats = chats
+        self._seqs = seqs
+        self._segments = segments
+        # Сегмент могли переписать повторной архивацией — смещения в кэше больше не действительны
+        self._cache.clear()
+
+
+message_archive = MessageArchive(
+    directory=settings.MESSAGE_ARCHIVE_DIR,
+    block_messages=settings.MESSAGE_ARCHIVE_BLOCK_MESSAGES,
+    cache_blocks=settings.MESSAGE_ARCHIVE_CACHE_BLOCKS,
+)
+
+Gauge("message_archive_segments", "Archived message segments visible to this worker", lambda: message_archive._segments)
+FunctionCounter("message_archive_block_reads_total", "Archive blocks decompressed for history reads",
+                lambda: message_archive.block_reads)
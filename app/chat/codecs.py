@@ -0,0 +1,134 @@
+"""Форматы кадров WebSocket /chat/ws, выбираемые через подпротокол (Sec-WebSocket-Protocol).
+
+JSON — по умолчанию: без подпротокола или с "chat.json". "chat.msgpack" — двоичный MessagePack:
+ключи событий в нем — числа из FIELD_KEYS, а время (created_at, edited_at) — миллисекунды от эпохи
+вместо ISO-строк. Клиент перечисляет подпротоколы в порядке предпочтения, сервер берет первый известный ему.
+"""
+import json
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple, Union
+import msgpack
+from app.metrics import Counter
+
+SUBPROTOCOL_JSON = "chat.json"
+SUBPROTOCOL_MSGPACK = "chat.msgpack"
+
+# Числовые ключи полей в MessagePack. Таблица только дополняется: клиенты старых версий читают те же номера.
+# Поля, которых нет в таблице, передаются со строковым ключом
+FIELD_KEYS = {
+    'type': 0,
+    'id': 1,
+    'chat_id': 2,
+    'seq': 3,
+    'sender_id': 4,
+    'sender_name': 5,
+    'content': 6,
+    'created_at': 7,
+    'edited_at': 8,
+    'user_id': 9,
+    'events': 10,
+    'chats': 11,
+    'error': 12,
+    'scope': 13,
+    'retry_after': 14,
+    'client_id': 15,
+    'ops': 16,
+    'acks': 17,
+    'duplicate': 18,
+}
+FIELD_NAMES = {key: name for name, key in FIELD_KEYS.items()}
+TIME_FIELDS = {'created_at', 'edited_at'}
+
+Frame = Union[str, bytes]
+
+negotiated_connections = Counter("ws_connections_by_format_total", "WebSocket connections by negotiated frame format",
+                                 ["format"])
+
+
+def _epoch_ms(value: str) -> int:
+    moment = datetime.fromisoformat(value)
+    # Время без зоны пишет БД (now() / CURRENT_TIMESTAMP) — это UTC
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _pack_fields(message: dict) -> dict:
+    """Числовые ключи в кадре и в событиях внутри списков (replay); вложенные словари — данные, их не трогаем"""
+    packed = {}
+    for key, value in message.items():
+        if key in TIME_FIELDS and isinstance(value, str):
+            value = _epoch_ms(value)
+        elif isinstance(value, list):
+            value = [_pack_fields(item) if isinstance(item, dict) else item for item in value]
+        packed[FIELD_KEYS.get(key, key)] = value
+    return packed
+
+
+def _unpack_fields(message: dict) -> dict:
+    unpacked = {}
+    for key, value in message.items():
+        key = FIELD_NAMES.get(key, key)
+        if key in TIME_FIELDS and isinstance(value, int):
+            value = datetime.fromtimestamp(value / 1000, timezone.utc).isoformat()
+        elif isinstance(value, list):
+            value = [_unpack_fields(item) if isinstance(item, dict) else item for item in value]
+        unpacked[key] = value
+    return unpacked
+
+
+class JsonCodec:
+    name = "json"
+    invalid_frame_error = "Invalid JSON"
+
+    @staticmethod
+    def encode(message: dict) -> str:
+        return json.dumps(message)
+
+    @staticmethod
+    def decode(data: Frame) -> dict:
+        message = json.loads(data)
+        if not isinstance(message, dict):
+            raise ValueError("Frame is not an object")
+        return message
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    invalid_frame_error = "Invalid MessagePack"
+
+    @staticmethod
+    def encode(message: dict) -> bytes:
+        return msgpack.packb(_pack_fields(message), use_bin_type=True)
+
+    @staticmethod
+    def decode(data: Frame) -> dict:
+        if not isinstance(data, bytes):
+            raise ValueError("MessagePack frames must be binary")
+        try:
+            message = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f"Invalid MessagePack frame: {e}") from e
+        if not isinstance(message, dict):
+            raise ValueError("Frame is not a map")
+        return _unpack_fields(message)
+
+
+Codec = Union[JsonCodec, MsgpackCodec]
+
+json_codec = JsonCodec()
+CODECS = {SUBPROTOCOL_JSON: json_codec, SUBPROTOCOL_MSGPACK: MsgpackCodec()}
+
+
+def negotiate(offered: List[str]) -> Tuple[Codec, Optional[str]]:
+    """Формат кадров и подпротокол для ответа на рукопожатие: первый известный из предложенных клиентом.
+
+    Если клиент не предложил ни одного известного, отвечаем без подпротокола и говорим JSON.
+    """
+    for subprotocol in offered:
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            negotiated_connections.inc(1, codec.name)
+            return codec, subprotocol
+    negotiated_connections.inc(1, json_codec.name)
+    return json_codec, None
@@ -1,88 +1,684 @@
-from sqlalchemy import select, and_, or_, func
-from sqlalchemy.orm import selectinload
-from app.dao.base import BaseDAO
-from app.chat.models import Chat, Message
-from app.database import async_session_maker
-from typing import List
+from sqlalchemy import select, insert, update, delete, exists, bindparam, and_, or_, func, tuple_, literal, literal_column, table, column
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.dao.base import BaseDAO, after_commit, session_scope
+from app.chat.archive import message_archive
+from app.chat.models import Chat, Message, chat_events, chat_participants, client_messages
+from app.chat.search import HIGHLIGHT_START, HIGHLIGHT_STOP, fts5_query, search_terms
+from app.users.dao import UsersDAO
+from app.users.models import User
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 class ChatsDAO(BaseDAO):
     model = Chat
 
     @classmethod
-    async def get_user_chats(cls, user_id: int):
-        """Получить все чаты пользователя"""
-        async with async_session_maker() as session:
-            query = (
-                select(cls.model)
-                .join(cls.model.participants)
-                .where(cls.model.participants.any(id=user_id))
-                .options(selectinload(cls.model.participants))
-                .order_by(cls.model.created_at.desc())
+    async def get_user_chats(cls, user_id: int, session: AsyncSession = None) -> List[dict]:
+        """Получить чаты пользователя одним запросом: последнее сообщение и число непрочитанных.
+
+        Свежие по активности чаты идут первыми. Непрочитанные считаются не дальше UNREAD_COUNT_CAP.
+        """
+        cap = settings.UNREAD_COUNT_CAP
+        last_message = aliased(Message)
+        last_sender = aliased(User)
+        unread = (
+            select(Message.id)
+            .where(
+                Message.chat_id == cls.model.id,
+                Message.id > func.coalesce(chat_participants.c.last_read_message_id, 0),
+                Message.sender_id != user_id
+            )
+            .limit(cap + 1)
+            .correlate(cls.model, chat_participants)
+            .subquery()
+        )
+        query = (
+            select(
+                cls.model.id,
+                cls.model.name,
+                cls.model.created_at,
+                cls.model.participant_count,
+                cls.model.last_message_id,
+                cls.model.last_message_at,
+                func.substr(last_message.content, 1, settings.LAST_MESSAGE_PREVIEW_LENGTH)
+                .label('last_message_preview'),
+                last_message.sender_id.label('last_message_sender_id'),
+                last_sender.name.label('last_message_sender_name'),
+                chat_participants.c.last_read_message_id,
+                select(func.count()).select_from(unread).scalar_subquery().label('unread_count'),
             )
+            .join(chat_participants, chat_participants.c.chat_id == cls.model.id)
+            .outerjoin(last_message, last_message.id == cls.model.last_message_id)
+            .outerjoin(last_sender, last_sender.id == last_message.sender_id)
+            .where(chat_participants.c.user_id == user_id)
+            .order_by(func.coalesce(cls.model.last_message_at, cls.model.created_at).desc(), cls.model.id.desc())
+        )
+        async with session_scope(session) as session:
             result = await session.execute(query)
-            return result.scalars().all()
+            chats = [dict(row) for row in result.mappings().all()]
+        for chat in chats:
+            chat['unread_overflow'] = chat['unread_count'] > cap
+            chat['unread_count'] = min(chat['unread_count'], cap)
+        return chats
 
     @classmethod
-    async def create_chat(cls, name: str = None, participant_ids: List[int] = None):
-        """Создать новый чат с участниками"""
-        async with async_session_maker() as session:
-            async with session.begin():
-                # Создаем чат
-                new_chat = cls.model(name=name)
-                session.add(new_chat)
-                await session.flush()  # Получаем ID чата
-
-                # Добавляем участников
-                from app.users.dao import UsersDAO
-                for user_id in participant_ids:
-                    user = await UsersDAO.find_one_or_none_by_id(user_id)
-                    if user:
-                        new_chat.participants.append(user)
+    async def get_participant_ids(cls, chat_id: int, session: AsyncSession = None) -> List[int]:
+        """Получить ID участников чата"""
+        async with session_scope(session) as session:
+            query = select(chat_participants.c.user_id).where(chat_participants.c.chat_id == chat_id)
+            result = await session.execute(query)
+            return list(result.scalars().all())
 
-                await session.commit()
-                return new_chat
+    @classmethod
+    async def create_chat(cls, name: str = None, participant_ids: List[int] = None, session: AsyncSession = None):
+        """Создать новый чат с участниками. Два запроса независимо от числа участников"""
+        async with session_scope(session, commit=True) as session:
+            new_chat = cls.model(name=name)
+            session.add(new_chat)
+            await session.flush()  # Получаем ID чата
+            await cls.add_participants(new_chat.id, participant_ids or [], session=session)
+        return new_chat
 
     @classmethod
-    async def add_participant_to_chat(cls, chat_id: int, user_id: int):
+    async def add_participant_to_chat(cls, chat_id: int, user_id: int, session: AsyncSession = None):
         """Добавить участника в чат"""
-        async with async_session_maker() as session:
-            async with session.begin():
-                chat = await session.get(cls.model, chat_id)
-                user = await session.get(UsersDAO.model, user_id)
+        return await cls.add_participants(chat_id, [user_id], session=session)
 
-                if chat and user and user not in chat.participants:
-                    chat.participants.append(user)
+    @classmethod
+    async def add_participants(cls, chat_id: int, user_ids: List[int], session: AsyncSession = None) -> int:
+        """Добавить участников одним INSERT ... SELECT.
+
+        Несуществующие пользователи и те, кто уже в чате, пропускаются. Возвращает число добавленных.
+        """
+        from app.chat.membership import chat_membership
+        user_ids = set(user_ids)
+        if not user_ids:
+            return 0
 
-                await session.commit()
+        outer_session = session
+        async with session_scope(session, commit=True) as session:
+            chat_exists = exists().where(cls.model.id == chat_id)
+            already_in_chat = exists().where(
+                chat_participants.c.chat_id == chat_id,
+                chat_participants.c.user_id == User.id
+            )
+            query = insert(chat_participants).from_select(
+                ['chat_id', 'user_id'],
+                select(literal(chat_id), User.id)
+                .where(chat_exists, User.id.in_(user_ids), ~already_in_chat)
+            ).returning(chat_participants.c.user_id)
+            added = sorted((await session.execute(query)).scalars().all())
+            if added:
+                # Каждый вошедший — событие join в журнале чата
+                first_seq = await cls.allocate_seq(chat_id, len(added), session=session,
+                                                   participant_count=cls.model.__table__.c.participant_count + len(added))
+                await session.execute(insert(chat_events), [
+                    {'chat_id': chat_id, 'seq': first_seq + i, 'type': 'join', 'user_id': user_id}
+                    for i, user_id in enumerate(added)
+                ])
+
+        if added:
+            await after_commit(outer_session, lambda: chat_membership.invalidate(chat_id))
+        return len(added)
+
+    @classmethod
+    async def allocate_seq(cls, chat_id: int, count: int = 1, session: AsyncSession = None,
+                           **values) -> Optional[int]:
+        """Выдать count номеров событий чата подряд и вернуть первый; None — чата нет.
+
+        UPDATE держит блокировку строки чата до конца транзакции, поэтому события чата фиксируются
+        в порядке seq: если виден seq N, все меньшие уже зафиксированы. values — другие поля чата,
+        которые нужно обновить тем же запросом.
+        """
+        table = cls.model.__table__
+        query = (
+            update(table)
+            .where(table.c.id == chat_id)
+            .values(last_seq=table.c.last_seq + count, **values)
+            .returning(table.c.last_seq)
+        )
+        async with session_scope(session, commit=True) as session:
+            last_seq = (await session.execute(query)).scalar_one_or_none()
+        return None if last_seq is None else last_seq - count + 1
+
+    @classmethod
+    async def get_last_seqs(cls, user_id: int, chat_ids: Iterable[int], session: AsyncSession = None) -> Dict[int, int]:
+        """Последний seq каждого из чатов chat_ids, в которых состоит пользователь; чужие чаты пропускаются"""
+        query = (
+            select(cls.model.id, cls.model.last_seq)
+            .join(chat_participants, chat_participants.c.chat_id == cls.model.id)
+            .where(chat_participants.c.user_id == user_id, cls.model.id.in_(list(chat_ids)))
+        )
+        async with session_scope(session) as session:
+            result = await session.execute(query)
+            return {chat_id: last_seq for chat_id, last_seq in result.all()}
+
+    @classmethod
+    async def touch_last_message(cls, messages: Iterable[Message], session: AsyncSession):
+        """Обновить last_message_id/last_message_at чатов: один UPDATE на чат, только вперед"""
+        latest = {}
+        for message in messages:
+            current = latest.get(message.chat_id)
+            if current is None or message.id > current.id:
+                latest[message.chat_id] = message
+        if not latest:
+            return
+
+        table = cls.model.__table__
+        query = (
+            update(table)
+            .where(
+                table.c.id == bindparam('b_chat_id'),
+                or_(table.c.last_message_id.is_(None), table.c.last_message_id < bindparam('b_message_id'))
+            )
+            .values(last_message_id=bindparam('b_message_id'), last_message_at=bindparam('b_created_at'))
+        )
+        await session.execute(query, [
+            {'b_chat_id': chat_id, 'b_message_id': message.id, 'b_created_at': message.created_at}
+            for chat_id, message in latest.items()
+        ])
+
+    @classmethod
+    async def mark_read(cls, chat_id: int, user_id: int, message_id: int = None, session: AsyncSession = None) -> int:
+        """Сдвинуть указатель прочитанного вперед: до message_id или до последнего сообщения чата"""
+        last_message_id = select(cls.model.last_message_id).where(cls.model.id == chat_id).scalar_subquery()
+        target = last_message_id if message_id is None else literal(message_id)
+        query = (
+            update(chat_participants)
+            .where(
+                chat_participants.c.chat_id == chat_id,
+                chat_participants.c.user_id == user_id,
+                target <= last_message_id,
+                or_(chat_participants.c.last_read_message_id.is_(None),
+                    chat_participants.c.last_read_message_id < target)
+            )
+            .values(last_read_message_id=target)
+        )
+        async with session_scope(session, commit=True) as session:
+            result = await session.execute(query)
+            return result.rowcount
 
 
 class MessagesDAO(BaseDAO):
     model = Message
 
     @classmethod
-    async def get_chat_messages(cls, chat_id: int):
-        """Получить сообщения чата"""
-        async with async_session_maker() as session:
+    async def get_chat_messages(cls, chat_id: int, before_id: int = None, after_id: int = None, limit: int = None,
+                                session: AsyncSession = None):
+        """Получить сообщения чата.
+
+        Keyset-пагинация по (created_at, id): before_id/after_id — ID сообщений-курсоров.
+        Без курсоров и с limit возвращается последняя страница. Порядок всегда от старых к новым.
+        Если в БД страница неполная, она дополняется из архива старых партиций.
+        """
+        archived = message_archive.has_chat(chat_id)
+        async with session_scope(session) as session:
+            key = tuple_(cls.model.created_at, cls.model.id)
+            # Курсор может указывать на сообщение, которое уже в архиве, а не в БД
+            before_key = await message_archive.find_key(chat_id, before_id) if archived and before_id else None
+            after_key = await message_archive.find_key(chat_id, after_id) if archived and after_id else None
             query = (
                 select(cls.model)
                 .where(cls.model.chat_id == chat_id)
                 .options(selectinload(cls.model.sender))
-                .order_by(cls.model.created_at)
+            )
+            if before_id is not None:
+                query = query.where(key < (tuple_(literal(before_key[0]), literal(before_key[1])) if before_key
+                                           else cls._cursor_key(chat_id, before_id)))
+            if after_id is not None:
+                query = query.where(key > (tuple_(literal(after_key[0]), literal(after_key[1])) if after_key
+                                           else cls._cursor_key(chat_id, after_id)))
+
+            # Страницу "после курсора" читаем вперед, все остальные — с конца
+            newest_first = after_id is None and limit is not None
+            if newest_first:
+                query = query.order_by(cls.model.created_at.desc(), cls.model.id.desc())
+            else:
+                query = query.order_by(cls.model.created_at, cls.model.id)
+            if limit is not None:
+                query = query.limit(limit)
+
+            result = await session.execute(query)
+            messages = list(result.scalars().all())
+            if newest_first:
+                messages.reverse()
+
+            # Вперед от архивного курсора архив нужен всегда: его сообщения идут раньше тех, что в БД
+            if archived and (after_key is not None or limit is None or len(messages) < limit):
+                messages = await cls._with_archived(chat_id, messages, before_key, after_id, after_key, limit,
+                                                    session)
+            return messages
+
+    @classmethod
+    async def _with_archived(cls, chat_id: int, messages: list, before_key, after_id, after_key, limit,
+                             session: AsyncSession) -> list:
+        """Дополнить неполную страницу из БД сообщениями из архива — они всегда старше сообщений в БД"""
+        if after_id is not None:
+            # Вперед от курсора архив читается, только если сам курсор в архиве
+            if after_key is None:
+                return messages
+            archived = await message_archive.read(chat_id, after=after_key, limit=limit)
+        else:
+            if messages:
+                before_key = (messages[0].created_at, messages[0].id)
+            archived = await message_archive.read(
+                chat_id, before=before_key, limit=None if limit is None else limit - len(messages)
+            )
+        if not archived:
+            return messages
+
+        senders = await UsersDAO.find_many_by_ids({message.sender_id for message in archived}, session=session)
+        senders = {user.id: user for user in senders}
+        for message in archived:
+            message.sender = senders.get(message.sender_id)
+        # Пока партиция архивируется, ее строки есть и в сегменте, и в БД
+        archived_ids = {message.id for message in archived}
+        messages = archived + [message for message in messages if message.id not in archived_ids]
+        return messages if limit is None or after_id is None else messages[:limit]
+
+    @classmethod
+    async def get_recent_messages(cls, chat_id: int, limit: int, session: AsyncSession = None) -> List[dict]:
+        """Последние limit сообщений чата в виде ответа API. При попадании в кэш запросов к БД нет"""
+        from app.chat.history_cache import recent_messages, serialize_message
+        page = recent_messages.get_page(chat_id, limit)
+        if page is not None:
+            return page
+
+        fetch = max(limit, recent_messages.per_chat)
+        recent_messages.begin_load(chat_id)
+        try:
+            messages = await cls.get_chat_messages(chat_id, limit=fetch, session=session)
+        except Exception:
+            recent_messages.cancel_load(chat_id)
+            raise
+        payloads = [serialize_message(message) for message in messages]
+        # Вся история в кэше, только если ее меньше, чем запрошено, и она влезла в per_chat
+        exhaustive = len(messages) < fetch and len(messages) <= recent_messages.per_chat
+        recent_messages.load(chat_id, payloads[-recent_messages.per_chat:], exhaustive=exhaustive)
+        return payloads[-limit:]
+
+    @classmethod
+    async def edit_message(cls, message_id: int, sender_id: int, content: str,
+                           session: AsyncSession = None) -> Optional[dict]:
+        """Изменить текст своего сообщения. Возвращает событие message_edited или None, если сообщения нет.
+
+        Сообщения из архивных сегментов в БД уже нет — их не изменить.
+        """
+        async with session_scope(session, commit=True) as session:
+            chat_id = await cls._own_message_chat(message_id, sender_id, session)
+            if chat_id is None:
+                return None
+            seq = await ChatsDAO.allocate_seq(chat_id, session=session)
+            result = await session.execute(
+                update(cls.model.__table__)
+                .where(cls.model.id == message_id, cls.model.sender_id == sender_id)
+                .values(content=content, updated_at=func.now())
+                .returning(cls.model.updated_at)
+            )
+            edited_at = result.scalar_one_or_none()
+            if edited_at is None:
+                # Удалено, пока ждали блокировку чата; выданный seq останется пропуском
+                return None
+            await session.execute(insert(chat_events).values(chat_id=chat_id, seq=seq, type='edit',
+                                                             message_id=message_id))
+        return {'type': 'message_edited', 'chat_id': chat_id, 'seq': seq, 'id': message_id, 'content': content,
+                'edited_at': edited_at.isoformat()}
+
+    @classmethod
+    async def delete_message(cls, message_id: int, sender_id: int, session: AsyncSession = None) -> Optional[dict]:
+        """Удалить свое сообщение. Возвращает событие message_deleted или None, если сообщения нет"""
+        async with session_scope(session, commit=True) as session:
+            chat_id = await cls._own_message_chat(message_id, sender_id, session)
+            if chat_id is None:
+                return None
+            seq = await ChatsDAO.allocate_seq(chat_id, session=session)
+            result = await session.execute(
+                delete(cls.model.__table__).where(cls.model.id == message_id, cls.model.sender_id == sender_id)
+            )
+            if not result.rowcount:
+                return None
+            await session.execute(insert(chat_events).values(chat_id=chat_id, seq=seq, type='delete',
+                                                             message_id=message_id))
+            # Удалили последнее сообщение — список чатов показывает предыдущее
+            previous = (
+                select(func.max(cls.model.id)).where(cls.model.chat_id == chat_id).scalar_subquery()
+            )
+            chats = Chat.__table__
+            await session.execute(
+                update(chats)
+                .where(chats.c.id == chat_id, chats.c.last_message_id == message_id)
+                .values(
+                    last_message_id=previous,
+                    last_message_at=select(cls.model.created_at).where(cls.model.id == previous).scalar_subquery()
+                )
+            )
+        return {'type': 'message_deleted', 'chat_id': chat_id, 'seq': seq, 'id': message_id}
+
+    @classmethod
+    async def _own_message_chat(cls, message_id: int, sender_id: int, session: AsyncSession) -> Optional[int]:
+        query = select(cls.model.chat_id).where(cls.model.id == message_id, cls.model.sender_id == sender_id)
+        return (await session.execute(query)).scalar_one_or_none()
+
+    @classmethod
+    async def get_chat_events(cls, chat_id: int, after_seq: int, until_seq: int,
+                              session: AsyncSession = None) -> List[dict]:
+        """События чата с seq в (after_seq, until_seq] по порядку, в том виде, в каком их рассылает WebSocket.
+
+        Новые сообщения берутся из messages, остальное — из chat_events. Сообщения отдаются в текущем виде;
+        у удаленных остается только событие delete, поэтому в последовательности бывают пропуски.
+        """
+        from app.chat.history_cache import serialize_message
+        async with session_scope(session) as session:
+            result = await session.execute(
+                select(cls.model)
+                .where(cls.model.chat_id == chat_id, cls.model.seq > after_seq, cls.model.seq <= until_seq)
+                .options(selectinload(cls.model.sender))
+                .order_by(cls.model.seq)
+            )
+            events = [dict(serialize_message(message), type='message') for message in result.scalars().all()]
+
+            result = await session.execute(
+                select(chat_events.c.seq, chat_events.c.type, chat_events.c.message_id, chat_events.c.user_id,
+                       cls.model.content, cls.model.updated_at)
+                .outerjoin(cls.model, and_(cls.model.id == chat_events.c.message_id,
+                                           cls.model.chat_id == chat_events.c.chat_id))
+                .where(chat_events.c.chat_id == chat_id, chat_events.c.seq > after_seq,
+                       chat_events.c.seq <= until_seq)
+                .order_by(chat_events.c.seq)
+            )
+            for row in result.all():
+                if row.type == 'join':
+                    events.append({'type': 'member_joined', 'chat_id': chat_id, 'seq': row.seq,
+                                   'user_id': row.user_id})
+                elif row.type == 'delete' or row.content is None:
+                    # Правка сообщения, удаленного позже, для клиента равна удалению
+                    events.append({'type': 'message_deleted', 'chat_id': chat_id, 'seq': row.seq,
+                                   'id': row.message_id})
+                else:
+                    events.append({'type': 'message_edited', 'chat_id': chat_id, 'seq': row.seq,
+                                   'id': row.message_id, 'content': row.content,
+                                   'edited_at': row.updated_at.isoformat()})
+        events.sort(key=lambda event: event['seq'])
+        return events
+
+    @classmethod
+    async def get_messages_since(cls, chat_id: int, since_seq: int, limit: int, session: AsyncSession = None):
+        """Получить до limit сообщений чата с seq больше since_seq, по возрастанию seq.
+
+        Курсор — seq, а не ID: ID выдаются не в порядке коммита, и сообщение с меньшим ID, зафиксированное
+        после ответа с большим, курсор по ID пропустил бы навсегда. seq выдается под блокировкой строки чата,
+        поэтому если виден seq N, все меньшие уже зафиксированы.
+        """
+        async with session_scope(session) as session:
+            query = (
+                select(cls.model)
+                .where(cls.model.chat_id == chat_id, cls.model.seq > since_seq)
+                .options(selectinload(cls.model.sender))
+                .order_by(cls.model.seq)
+                .limit(limit)
             )
             result = await session.execute(query)
-            return result.scalars().all()
+            return list(result.scalars().all())
 
     @classmethod
-    async def add_message(cls, chat_id: int, sender_id: int, content: str):
-        """Добавить сообщение в чат"""
-        async with async_session_maker() as session:
-            async with session.begin():
-                new_message = cls.model(
-                    chat_id=chat_id,
-                    sender_id=sender_id,
-                    content=content
+    async def get_user_messages_since(cls, user_id: int, since_id: int, limit: int, session: AsyncSession = None):
+        """Получить до limit сообщений из всех чатов пользователя с ID больше since_id, по возрастанию ID"""
+        async with session_scope(session) as session:
+            user_chats = select(chat_participants.c.chat_id).where(chat_participants.c.user_id == user_id)
+            query = (
+                select(cls.model)
+                .where(cls.model.chat_id.in_(user_chats), cls.model.id > since_id)
+                .options(selectinload(cls.model.sender))
+                .order_by(cls.model.id)
+                .limit(limit)
+            )
+            result = await session.execute(query)
+            return list(result.scalars().all())
+
+    @classmethod
+    async def search_messages(cls, user_id: int, query: str, chat_id: int = None, limit: int = 20, offset: int = 0,
+                              session: AsyncSession = None) -> List[dict]:
+        """Найти сообщения в чатах пользователя: сначала самые релевантные, с фрагментом текста.
+
+        В Postgres ранжируются только SEARCH_MAX_CANDIDATES самых свежих совпадений — иначе частое слово
+        заставило бы считать rank по миллионам строк.
+        """
+        if not search_terms(query):
+            return []
+        user_chats = select(chat_participants.c.chat_id).where(chat_participants.c.user_id == user_id)
+        async with session_scope(session) as session:
+            if session.get_bind().dialect.name == 'postgresql':
+                statement = cls._search_postgres(query, user_chats, chat_id, limit, offset)
+            else:
+                statement = cls._search_sqlite(query, user_chats, chat_id, limit, offset)
+            result = await session.execute(statement)
+            return [dict(row) for row in result.mappings().all()]
+
+    @classmethod
+    def _search_postgres(cls, query: str, user_chats, chat_id: int, limit: int, offset: int):
+        # Конфигурацию пишем литералом: regconfig-параметр asyncpg передавать не умеет
+        config = literal_column("'simple'")
+        ts_query = func.plainto_tsquery(config, query)
+        content_tsv = literal_column('messages.content_tsv', type_=TSVECTOR)
+        candidates = (
+            select(
+                cls.model.id, cls.model.chat_id, cls.model.sender_id, cls.model.content, cls.model.created_at,
+                func.ts_rank_cd(content_tsv, ts_query).label('rank')
+            )
+            .where(content_tsv.op('@@')(ts_query), cls.model.chat_id.in_(user_chats))
+            .order_by(cls.model.id.desc())
+            .limit(settings.SEARCH_MAX_CANDIDATES)
+        )
+        if chat_id is not None:
+            candidates = candidates.where(cls.model.chat_id == chat_id)
+        candidates = candidates.subquery()
+
+        page = (
+            select(candidates)
+            .order_by(candidates.c.rank.desc(), candidates.c.id.desc())
+            .limit(limit)
+            .offset(offset)
+            .subquery()
+        )
+        # ts_headline дорогой — считаем его только для строк страницы
+        headline_options = f"StartSel={HIGHLIGHT_START},StopSel={HIGHLIGHT_STOP},MaxFragments=2,MaxWords=20,MinWords=5"
+        return (
+            select(
+                page.c.id, page.c.chat_id, page.c.sender_id, User.name.label('sender_name'), page.c.created_at,
+                page.c.rank,
+                func.ts_headline(config, page.c.content, ts_query, headline_options).label('snippet')
+            )
+            .join(User, User.id == page.c.sender_id)
+            .order_by(page.c.rank.desc(), page.c.id.desc())
+        )
+
+    @classmethod
+    def _search_sqlite(cls, query: str, user_chats, chat_id: int, limit: int, offset: int):
+        messages_fts = table('messages_fts', column('rowid'))
+        fts = literal_column('messages_fts')
+        # bm25 тем меньше, чем релевантнее; наружу отдаем "больше — лучше", как в Postgres
+        rank = (-func.bm25(fts)).label('rank')
+        statement = (
+            select(
+                cls.model.id, cls.model.chat_id, cls.model.sender_id, User.name.label('sender_name'),
+                cls.model.created_at, rank,
+                func.snippet(fts, 0, HIGHLIGHT_START, HIGHLIGHT_STOP, '…', 16).label('snippet')
+            )
+            .select_from(messages_fts)
+            .join(cls.model, cls.model.id == messages_fts.c.rowid)
+            .join(User, User.id == cls.model.sender_id)
+            .where(fts.op('MATCH')(fts5_query(query)), cls.model.chat_id.in_(user_chats))
+            .order_by(rank.desc(), cls.model.id.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        if chat_id is not None:
+            statement = statement.where(cls.model.chat_id == chat_id)
+        return statement
+
+    @classmethod
+    def _cursor_key(cls, chat_id: int, message_id: int):
+        created_at = (
+            select(cls.model.created_at)
+            .where(cls.model.id == message_id, cls.model.chat_id == chat_id)
+            .scalar_subquery()
+        )
+        return tuple_(created_at, literal(message_id))
+
+    @classmethod
+    async def add_message(cls, chat_id: int, sender_id: int, content: str, sender_name: str = None,
+                          session: AsyncSession = None):
+        """Добавить сообщение в чат.
+
+        При включенном group-commit writer сообщение пишется им и фиксируется сразу, даже если передана сессия.
+        С sender_name сообщение после коммита попадает в кэш последних сообщений чата.
+        """
+        from app.chat.history_cache import recent_messages, serialize_message
+        from app.chat.writer import message_writer
+        if message_writer.running:
+            new_message = await message_writer.add(chat_id=chat_id, sender_id=sender_id, content=content)
+            if sender_name is not None:
+                recent_messages.add(serialize_message(new_message, sender_name))
+            return new_message
+
+        outer_session = session
+        async with session_scope(session, commit=True) as session:
+            # Номер выдается первым: блокировка чата до коммита и задает порядок seq
+            seq = await ChatsDAO.allocate_seq(chat_id, session=session)
+            new_message = cls.model(
+                chat_id=chat_id,
+                sender_id=sender_id,
+                content=content,
+                seq=seq
+            )
+            session.add(new_message)
+            await session.flush()
+            await ChatsDAO.touch_last_message([new_message], session=session)
+
+        if sender_name is not None:
+            payload = serialize_message(new_message, sender_name)
+
+            async def remember():
+                recent_messages.add(payload)
+
+            await after_commit(outer_session, remember)
+        return new_message
+
+    @classmethod
+    async def insert_messages(cls, values: List[dict], session: AsyncSession) -> List[Message]:
+        """Записать сообщения одним INSERT ... RETURNING в транзакции вызывающего, с номерами событий и last_message.
+
+        Номера событий — по порядку в values; чаты блокируются в порядке ID, чтобы параллельные
+        пачки не взаимоблокировались.
+        """
+        counts = Counter(row_values['chat_id'] for row_values in values)
+        next_seq = {}
+        for chat_id in sorted(counts):
+            next_seq[chat_id] = await ChatsDAO.allocate_seq(chat_id, counts[chat_id], session=session)
+        values = [dict(row_values) for row_values in values]
+        for row_values in values:
+            seq = next_seq[row_values['chat_id']]
+            row_values['seq'] = seq
+            if seq is not None:
+                next_seq[row_values['chat_id']] = seq + 1
+        result = await session.execute(
+            insert(cls.model).returning(cls.model.id, cls.model.created_at, sort_by_parameter_order=True),
+            values
+        )
+        messages = [cls.model(id=row.id, created_at=row.created_at, **row_values)
+                    for row_values, row in zip(values, result.all())]
+        # Последнее сообщение чата обновляется в той же транзакции — одним UPDATE на чат
+        await ChatsDAO.touch_last_message(messages, session=session)
+        return messages
+
+    @classmethod
+    async def add_client_messages(cls, sender_id: int, ops: List[dict], sender_name: str = None,
+                                  session: AsyncSession = None) -> Tuple[List[dict], List[Message]]:
+        """Записать пачку сообщений {'client_id', 'chat_id', 'content'} одной транзакцией.
+
+        Возвращает подтверждение на каждую op в ее порядке — {'client_id', 'id', 'chat_id', 'seq', 'created_at'},
+        у повторов еще 'duplicate': True — и список новых сообщений. Сообщение с client_id, который
+        отправитель уже присылал, повторно не пишется: подтверждение берется из первой записи.
+        """
+        try:
+            acks, messages = await cls._add_client_messages(sender_id, ops, session)
+        except IntegrityError:
+            if session is not None:
+                raise
+            # Тот же client_id одновременно записало другое подключение пользователя: теперь это повтор
+            acks, messages = await cls._add_client_messages(sender_id, ops, None)
+
+        if sender_name is not None and messages:
+            from app.chat.history_cache import recent_messages, serialize_message
+            payloads = [serialize_message(message, sender_name) for message in messages]
+
+            async def remember():
+                for payload in payloads:
+                    recent_messages.add(payload)
+
+            await after_commit(session, remember)
+        return acks, messages
+
+    @classmethod
+    async def _add_client_messages(cls, sender_id: int, ops: List[dict],
+                                   session: Optional[AsyncSession]) -> Tuple[List[dict], List[Message]]:
+        async with session_scope(session, commit=True) as session:
+            result = await session.execute(
+                select(client_messages)
+                .where(client_messages.c.sender_id == sender_id,
+                       client_messages.c.client_id.in_({op['client_id'] for op in ops}))
+            )
+            stored = {row.client_id: cls._client_ack(row.client_id, row.message_id, row.chat_id, row.seq,
+                                                     row.created_at)
+                      for row in result.all()}
+            new_ops = {}
+            for op in ops:
+                if op['client_id'] not in stored:
+                    new_ops.setdefault(op['client_id'], op)
+            messages = []
+            if new_ops:
+                messages = await cls.insert_messages(
+                    [{'chat_id': op['chat_id'], 'sender_id': sender_id, 'content': op['content']}
+                     for op in new_ops.values()],
+                    session=session
                 )
-                session.add(new_message)
-                await session.commit()
-                return new_message
\ No newline at end of file
+                # Время записи — время сообщения: подтверждение повтора совпадает с первым
+                await session.execute(insert(client_messages), [
+                    {'sender_id': sender_id, 'client_id': client_id, 'chat_id': message.chat_id,
+                     'message_id': message.id, 'seq': message.seq, 'created_at': message.created_at}
+                    for client_id, message in zip(new_ops, messages)
+                ])
+
+        fresh = {client_id: cls._client_ack(client_id, message.id, message.chat_id, message.seq, message.created_at)
+                 for client_id, message in zip(new_ops, messages)}
+        acks = []
+        acked = {}
+        for op in ops:
+            client_id = op['client_id']
+            if client_id in acked:
+                # Тот же client_id встречается в пачке повторно
+                ack = dict(acked[client_id], duplicate=True)
+            elif client_id in stored:
+                ack = acked[client_id] = dict(stored[client_id], duplicate=True)
+            else:
+                ack = acked[client_id] = fresh[client_id]
+            acks.append(ack)
+        return acks, messages
+
+    @staticmethod
+    def _client_ack(client_id: str, message_id: int, chat_id: int, seq: Optional[int], created_at: datetime) -> dict:
+        return {'client_id': client_id, 'id': message_id, 'chat_id': chat_id, 'seq': seq,
+                'created_at': created_at.isoformat()}
+
+    @classmethod
+    async def prune_client_ids(cls, older_than: datetime, session: AsyncSession = None) -> int:
+        """Забыть клиентские ID старше older_than: повтор после этого срока запишется как новое сообщение"""
+        async with session_scope(session, commit=True) as session:
+            result = await session.execute(delete(client_messages).where(client_messages.c.created_at < older_than))
+            return result.rowcount
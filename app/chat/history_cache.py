@@ -0,0 +1,177 @@
+import bisect
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from app.chat.manager import CHAT_EVENTS_CHANNEL
+from app.chat.pubsub import BaseBroker, broker
+from app.config import settings
+from app.metrics import FunctionCounter, Gauge
+
+# Примерный расход памяти на сообщение сверх текста (dict, ключи, числа, строка времени) и на сам чат
+MESSAGE_OVERHEAD_BYTES = 400
+CHAT_OVERHEAD_BYTES = 200
+
+MESSAGE_FIELDS = ('id', 'chat_id', 'seq', 'sender_id', 'sender_name', 'content', 'created_at')
+
+
+class _ChatEntry:
+    __slots__ = ('ids', 'messages', 'size', 'exhaustive')
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.messages: List[dict] = []
+        self.size = 0
+        # В кэше вся история чата, а не только ее хвост
+        self.exhaustive = False
+
+
+class RecentMessagesCache:
+    """Последние per_chat сообщений активных чатов в памяти воркера, уже в виде ответа API.
+
+    Чат попадает в кэш при промахе первой страницы истории, дальше пополняется новыми сообщениями —
+    своими после коммита и чужими из событий broker. Чаты вытесняются по LRU, когда суммарный
+    размер превышает max_bytes.
+    """
+
+    def __init__(self, per_chat: int, max_bytes: int, broker: BaseBroker):
+        self.per_chat = per_chat
+        self.max_bytes = max_bytes
+        self._chats: "OrderedDict[int, _ChatEntry]" = OrderedDict()
+        # Сообщения, пришедшие, пока чат читается из БД: попадут в кэш вместе с результатом чтения
+        # None — во время чтения чат инвалидирован, прочитанное кэшировать нельзя
+        self._loading: Dict[int, Optional[List[dict]]] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        broker.subscribe(CHAT_EVENTS_CHANNEL, self._on_event)
+
+    def get_page(self, chat_id: int, limit: int) -> Optional[List[dict]]:
+        """Последние limit сообщений чата или None, если кэш не может ответить"""
+        entry = self._chats.get(chat_id)
+        if entry is None or (len(entry.messages) < limit and not entry.exhaustive):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._chats.move_to_end(chat_id)
+        return entry.messages[-limit:]
+
+    def begin_load(self, chat_id: int):
+        """Вызвать до чтения первой страницы из БД, чтобы не потерять сообщения, пришедшие во время чтения"""
+        self._loading.setdefault(chat_id, [])
+
+    def cancel_load(self, chat_id: int):
+        self._loading.pop(chat_id, None)
+
+    def load(self, chat_id: int, messages: List[dict], exhaustive: bool):
+        """Положить в кэш прочитанную из БД первую страницу (по возрастанию ID)"""
+        pending = self._loading.pop(chat_id, [])
+        if pending is None:
+            return
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = _ChatEntry()
+            self._resize(entry, CHAT_OVERHEAD_BYTES)
+        entry.exhaustive = entry.exhaustive or exhaustive
+        for message in messages + pending:
+            self._insert(entry, message)
+        self._chats.move_to_end(chat_id)
+        self._evict()
+
+    def add(self, message: dict):
+        """Новое сообщение: попадает только в уже закэшированные или загружаемые чаты"""
+        chat_id = message['chat_id']
+        pending = self._loading.get(chat_id)
+        if pending is not None:
+            pending.append(message)
+        entry = self._chats.get(chat_id)
+        if entry is not None:
+            self._insert(entry, message)
+            self._evict()
+
+    def invalidate(self, chat_id: int):
+        if chat_id in self._loading:
+            self._loading[chat_id] = None
+        entry = self._chats.pop(chat_id, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        self._chats.clear()
+        self._loading.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._chats),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits_total": self.hits,
+            "misses_total": self.misses,
+            "evictions_total": self.evictions,
+        }
+
+    def _insert(self, entry: _ChatEntry, message: dict):
+        message_id = message['id']
+        position = bisect.bisect_left(entry.ids, message_id)
+        if position < len(entry.ids) and entry.ids[position] == message_id:
+            return
+        if position == 0 and len(entry.ids) >= self.per_chat:
+            # Старше всего, что держим, — в хвост истории не попадает
+            return
+        message = {field: message[field] for field in MESSAGE_FIELDS}
+        entry.ids.insert(position, message_id)
+        entry.messages.insert(position, message)
+        self._resize(entry, self._weight(message))
+        while len(entry.ids) > self.per_chat:
+            entry.ids.pop(0)
+            self._resize(entry, -self._weight(entry.messages.pop(0)))
+            entry.exhaustive = False
+
+    def _resize(self, entry: _ChatEntry, delta: int):
+        entry.size += delta
+        self.size += delta
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._chats:
+            _, entry = self._chats.popitem(last=False)
+            self.size -= entry.size
+            self.evictions += 1
+
+    @staticmethod
+    def _weight(message: dict) -> int:
+        return len(message['content']) + len(message['sender_name']) + MESSAGE_OVERHEAD_BYTES
+
+    async def _on_event(self, event: dict):
+        message = event['message']
+        if message.get('type') == 'message':
+            self.add(message)
+        elif message.get('type') in ('chat_changed', 'message_edited', 'message_deleted'):
+            self.invalidate(message['chat_id'])
+
+
+def serialize_message(message, sender_name: str = None) -> dict:
+    """Сообщение в том виде, в каком его отдает API и хранит кэш"""
+    return {
+        'id': message.id,
+        'chat_id': message.chat_id,
+        'seq': message.seq,
+        'sender_id': message.sender_id,
+        'sender_name': sender_name if sender_name is not None else message.sender.name,
+        'content': message.content,
+        'created_at': message.created_at.isoformat()
+    }
+
+
+recent_messages = RecentMessagesCache(
+    per_chat=settings.HISTORY_CACHE_MESSAGES_PER_CHAT,
+    max_bytes=settings.HISTORY_CACHE_MAX_BYTES,
+    broker=broker,
+)
+
+Gauge("history_cache_chats", "Chats in the recent messages cache", lambda: len(recent_messages._chats))
+Gauge("history_cache_bytes", "Estimated size of the recent messages cache", lambda: recent_messages.size)
+FunctionCounter("history_cache_hits_total", "First-page history requests served from the cache",
+                lambda: recent_messages.hits)
+FunctionCounter("history_cache_misses_total", "First-page history requests that went to the DB",
+                lambda: recent_messages.misses)
+FunctionCounter("history_cache_evictions_total", "Chats evicted from the cache", lambda: recent_messages.evictions)
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+from fastapi import WebSocket, WebSocketDisconnect
+from app.chat.codecs import Codec, Frame, json_codec, negotiate
+from app.chat.membership import chat_membership
+from app.chat.pubsub import BaseBroker, PayloadTooLargeError, broker
+from app.config import settings
+from app.metrics import SIZE_BUCKETS, Counter, Gauge, Histogram
+
+CHAT_EVENTS_CHANNEL = "chat_events"
+
+# Что делать с клиентом, который не успевает читать: пропускать ему кадры или отключать
+SLOW_CONSUMER_DROP = "drop"
+SLOW_CONSUMER_DISCONNECT = "disconnect"
+
+broadcast_seconds = Histogram("chat_broadcast_seconds", "Time to resolve recipients and publish a chat event")
+broadcast_recipients = Histogram("chat_broadcast_recipients", "Recipients per chat event", buckets=SIZE_BUCKETS)
+fanout_seconds = Histogram("chat_fanout_local_seconds", "Time to encode and enqueue an event to local connections")
+fanout_connections = Histogram("chat_fanout_local_connections", "Local connections an event was enqueued to",
+                               buckets=SIZE_BUCKETS)
+dropped_frames = Counter("chat_dropped_frames_total", "Frames dropped for slow consumers", ["transport"])
+
+
+class BaseConnection:
+    """Подписка пользователя на события с собственной ограниченной очередью исходящих кадров.
+
+    Кадр кодируется один раз на формат (frame_format) и раскладывается по очередям всех подписок этого формата.
+    """
+    frame_format = "json"
+    transport = None
+
+    def __init__(self, user_id: int, queue_size: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Optional[Frame]]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.closed = False
+
+    @staticmethod
+    def encode(message: dict) -> Frame:
+        return json.dumps(message)
+
+    def enqueue(self, frame: Frame) -> bool:
+        """Поставить готовый кадр в очередь. False — очередь переполнена"""
+        if self.closed:
+            return True
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    def send_json(self, message: dict) -> bool:
+        return self.enqueue(self.encode(message))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+class Connection(BaseConnection):
+    """WebSocket-подключение с задачей-отправителем, которая вычитывает очередь кадров.
+
+    Формат кадров (JSON или MessagePack) согласован при рукопожатии и задается codec.
+    """
+    transport = "websocket"
+
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int,
+                 codec: Codec = json_codec):
+        super().__init__(user_id, queue_size)
+        self.websocket = websocket
+        self.codec = codec
+        self.frame_format = codec.name
+        self.encode = codec.encode
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self, on_error):
+        self._writer = asyncio.create_task(self._write_loop(on_error))
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def send_now(self, message: dict):
+        """Отправить в обход очереди — только пока отправитель не запущен (досылка при подключении)"""
+        await self._send_frame(self.encode(message))
+
+    async def receive(self) -> Frame:
+        """Следующий кадр клиента, текстовый или двоичный, еще не разобранный (codec.decode)"""
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        data = message.get("bytes")
+        return data if data is not None else message.get("text")
+
+    async def _send_frame(self, frame: Frame):
+        if isinstance(frame, bytes):
+            await self.websocket.send_bytes(frame)
+        else:
+            await self.websocket.send_text(frame)
+
+    async def _write_loop(self, on_error):
+        while True:
+            frame = await self.queue.get()
+            try:
+                await self._send_frame(frame)
+            except Exception as e:
+                logging.error(f"Error sending message to user {self.user_id}: {e}")
+                await on_error(self)
+                return
+
+
+class EventStreamConnection(BaseConnection):
+    """Server-Sent Events подписка: очередь вычитывает тело StreamingResponse"""
+    frame_format = "sse"
+    transport = "sse"
+
+    @staticmethod
+    def encode(message: dict) -> str:
+        lines = []
+        if message.get('type') == 'message' and 'id' in message:
+            lines.append(f"id: {message['id']}")
+        lines.append(f"event: {message.get('type', 'message')}")
+        lines.append(f"data: {json.dumps(message)}")
+        return "\n".join(lines) + "\n\n"
+
+    @staticmethod
+    def event_id(frame: str) -> Optional[int]:
+        """ID сообщения из готового кадра, если он есть"""
+        if not frame.startswith("id: "):
+            return None
+        return int(frame[4:frame.index("\n")])
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        # Будим читателя: недоставленные кадры все равно выбрасываются
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def frames(self, heartbeat: float) -> AsyncIterator[str]:
+        """Кадры очереди; при простое — комментарий-heartbeat, чтобы прокси не закрыл соединение"""
+        while True:
+            try:
+                frame = await asyncio.wait_for(self.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if frame is None:
+                return
+            yield frame
+
+
+class ConnectionManager:
+    """Держит WebSocket-подключения своего воркера; доставка между воркерами идет через broker"""
+
+    def __init__(self, broker: BaseBroker, queue_size: int = 256, slow_consumer_policy: str = SLOW_CONSUMER_DROP):
+        self.active_connections: Dict[int, Set[BaseConnection]] = {}
+        # Long-poll запросы, ждущие нового сообщения в чате
+        self.chat_waiters: Dict[int, Set[asyncio.Future]] = {}
+        self.broker = broker
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        broker.subscribe(CHAT_EVENTS_CHANNEL, self._on_event)
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
+
+    def connection_counts_by_transport(self) -> Dict[tuple, int]:
+        counts = {("websocket",): 0, ("sse",): 0}
+        for connections in self.active_connections.values():
+            for connection in connections:
+                counts[(connection.transport,)] = counts.get((connection.transport,), 0) + 1
+        return counts
+
+    async def connect(self, websocket: WebSocket, user_id: int,
+                      replay: Callable[[Connection], Awaitable[None]] = None) -> Connection:
+        """Принять WebSocket в формате, согласованном по подпротоколам клиента, и подписать на события.
+
+        replay пишет в websocket напрямую до запуска отправителя: события, пришедшие за это время,
+        ждут в очереди и уходят клиенту после досылки, а не вперемешку с ней.
+        """
+        codec, subprotocol = negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(websocket, user_id, self.queue_size, codec)
+        self._register(connection)
+        if replay is not None:
+            try:
+                await replay(connection)
+            except BaseException:
+                self.disconnect(connection)
+                raise
+        connection.start(self._on_send_error)
+        return connection
+
+    def connect_event_stream(self, user_id: int) -> EventStreamConnection:
+        connection = EventStreamConnection(user_id, self.queue_size)
+        self._register(connection)
+        return connection
+
+    def _register(self, connection: BaseConnection):
+        self.active_connections.setdefault(connection.user_id, set()).add(connection)
+        logging.info(f"User {connection.user_id} connected. Active connections: {self.connection_count}")
+
+    def disconnect(self, connection: BaseConnection, code: int = 1000):
+        connections = self.active_connections.get(connection.user_id)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.active_connections[connection.user_id]
+        asyncio.get_running_loop().create_task(connection.close(code))
+        logging.info(f"User {connection.user_id} disconnected. Active connections: {self.connection_count}")
+
+    @contextmanager
+    def watch_chat(self, chat_id: int) -> Iterator[asyncio.Future]:
+        """Future, которое завершится при первом новом сообщении в чате.
+
+        Подписываться нужно до чтения из БД, иначе сообщение, пришедшее между чтением и ожиданием, потеряется.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.chat_waiters.setdefault(chat_id, set()).add(future)
+        try:
+            yield future
+        finally:
+            waiters = self.chat_waiters.get(chat_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self.chat_waiters[chat_id]
+
+    def _wake_chat_waiters(self, chat_id: int):
+        for future in self.chat_waiters.pop(chat_id, ()):
+            if not future.done():
+                future.set_result(None)
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        await self._publish([user_id], message)
+
+    async def broadcast_to_chat(self, chat_id: int, message: dict, exclude_user_id: int = None):
+        """Отправить сообщение всем участникам чата"""
+        await self.broadcast_many_to_chat(chat_id, [message], exclude_user_id)
+
+    async def broadcast_many_to_chat(self, chat_id: int, messages: List[dict], exclude_user_id: int = None):
+        """Отправить несколько событий участникам чата по порядку; участники определяются один раз"""
+        started = time.perf_counter()
+        participant_ids = await chat_membership.get_participant_ids(chat_id)
+        user_ids = [user_id for user_id in participant_ids if user_id != exclude_user_id]
+        for message in messages:
+            # Публикуем даже без получателей: событие нужно кэшам истории и long-poll запросам всех воркеров
+            await self._publish(user_ids, message)
+            broadcast_recipients.observe(len(user_ids))
+        broadcast_seconds.observe(time.perf_counter() - started)
+
+    async def _publish(self, user_ids: List[int], message: dict):
+        step = settings.PUBSUB_MAX_RECIPIENTS_PER_EVENT
+        for i in range(0, max(len(user_ids), 1), step):
+            chunk = user_ids[i:i + step]
+            try:
+                await self.broker.publish(CHAT_EVENTS_CHANNEL, {"user_ids": chunk, "message": message})
+            except PayloadTooLargeError as e:
+                # Слишком большое событие не пролезет в брокер — доставляем хотя бы своим подключениям
+                logging.warning(f"{e}; delivering to local connections only")
+                self._deliver_local(chunk, message)
+                if 'chat_id' in message:
+                    # Остальным воркерам сообщаем хотя бы, что чат изменился: кэши сбросят его, long-poll перечитает БД
+                    changed = {"type": "chat_changed", "chat_id": message['chat_id']}
+                    try:
+                        await self.broker.publish(CHAT_EVENTS_CHANNEL, {"user_ids": [], "message": changed})
+                    except Exception as e:
+                        logging.error(f"Pub/sub publish failed: {e}")
+            except Exception as e:
+                # Событие уже зафиксировано в БД: ошибка брокера не должна превращаться в 500 и повтор отправки.
+                # Остальные воркеры его не получат — их клиенты доберут пропущенное досылкой по seq
+                logging.error(f"Pub/sub publish failed: {e}; delivering to local connections only")
+                self._deliver_local(chunk, message)
+
+    async def _on_event(self, event: dict):
+        self._deliver_local(event["user_ids"], event["message"])
+
+    def _deliver_local(self, user_ids: List[int], message: dict):
+        if message.get('type') in ('message', 'chat_changed'):
+            self._wake_chat_waiters(message['chat_id'])
+
+        # Кодируем событие один раз на формат и только раскладываем кадр по очередям — медленный клиент никого не держит
+        started = time.perf_counter()
+        delivered = 0
+        frames: Dict[str, Frame] = {}
+        for user_id in user_ids:
+            for connection in tuple(self.active_connections.get(user_id, ())):
+                frame = frames.get(connection.frame_format)
+                if frame is None:
+                    frame = frames[connection.frame_format] = connection.encode(message)
+                delivered += 1
+                if not connection.enqueue(frame):
+                    self._on_slow_consumer(connection)
+        if delivered:
+            fanout_seconds.observe(time.perf_counter() - started)
+            fanout_connections.observe(delivered)
+
+    def _on_slow_consumer(self, connection: BaseConnection):
+        dropped_frames.inc(1, connection.transport)
+        if self.slow_consumer_policy == SLOW_CONSUMER_DISCONNECT:
+            logging.warning(f"User {connection.user_id} is too slow, disconnecting")
+            self.disconnect(connection, code=1013)
+        elif connection.dropped == 1 or connection.dropped % 100 == 0:
+            logging.warning(f"User {connection.user_id} is too slow, dropped {connection.dropped} frame(s)")
+
+    async def _on_send_error(self, connection: Connection):
+        self.disconnect(connection)
+
+
+manager = ConnectionManager(
+    broker,
+    queue_size=settings.WS_SEND_QUEUE_SIZE,
+    slow_consumer_policy=settings.WS_SLOW_CONSUMER_POLICY,
+)
+
+Gauge("chat_active_connections", "Open WebSocket and SSE connections on this worker",
+      manager.connection_counts_by_transport, ["transport"])
+Gauge("chat_active_users", "Users with at least one open connection on this worker",
+      lambda: len(manager.active_connections))
@@ -0,0 +1,106 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable
+from app.chat.pubsub import BaseBroker, broker
+from app.config import settings
+from app.metrics import Gauge
+
+CHAT_MEMBERSHIP_CHANNEL = "chat_membership"
+
+Loader = Callable[..., Awaitable[Iterable[int]]]
+
+
+class ChatMembershipIndex:
+    """Кэш chat_id -> ID участников в памяти воркера.
+
+    Чаты подгружаются лениво, вытесняются по LRU, когда суммарное число участников превышает max_members.
+    Инвалидация рассылается всем воркерам через broker.
+    """
+
+    def __init__(self, loader: Loader, broker: BaseBroker, max_members: int):
+        self.loader = loader
+        self.broker = broker
+        self.max_members = max_members
+        self._chats: "OrderedDict[int, FrozenSet[int]]" = OrderedDict()
+        self._size = 0
+        self._loading: Dict[int, asyncio.Future] = {}
+        broker.subscribe(CHAT_MEMBERSHIP_CHANNEL, self._on_invalidate)
+
+    async def get_participant_ids(self, chat_id: int, session=None) -> FrozenSet[int]:
+        members = self._chats.get(chat_id)
+        if members is not None:
+            self._chats.move_to_end(chat_id)
+            return members
+
+        # Параллельные промахи по одному чату ждут одну и ту же загрузку
+        future = self._loading.get(chat_id)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[chat_id] = future
+        try:
+            members = frozenset(await self.loader(chat_id, session=session))
+        except Exception as e:
+            self._loading.pop(chat_id, None)
+            future.set_exception(e)
+            future.exception()  # помечаем как обработанное, если никто не ждал
+            raise
+
+        # Если во время загрузки пришла инвалидация, результат не кэшируем
+        if self._loading.get(chat_id) is future:
+            del self._loading[chat_id]
+            self._store(chat_id, members)
+        future.set_result(members)
+        return members
+
+    async def is_participant(self, chat_id: int, user_id: int, session=None) -> bool:
+        return user_id in await self.get_participant_ids(chat_id, session=session)
+
+    async def invalidate(self, chat_id: int):
+        self.invalidate_local(chat_id)
+        await self.broker.publish(CHAT_MEMBERSHIP_CHANNEL, {"chat_id": chat_id})
+
+    def invalidate_local(self, chat_id: int):
+        self._loading.pop(chat_id, None)
+        members = self._chats.pop(chat_id, None)
+        if members is not None:
+            self._size -= self._weight(members)
+
+    def clear(self):
+        self._chats.clear()
+        self._loading.clear()
+        self._size = 0
+
+    def _store(self, chat_id: int, members: FrozenSet[int]):
+        if self._weight(members) > self.max_members:
+            return
+        self.invalidate_local(chat_id)
+        self._chats[chat_id] = members
+        self._size += self._weight(members)
+        while self._size > self.max_members:
+            _, evicted = self._chats.popitem(last=False)
+            self._size -= self._weight(evicted)
+
+    @staticmethod
+    def _weight(members: FrozenSet[int]) -> int:
+        # Пустой чат (или несуществующий) тоже занимает место в кэше
+        return max(1, len(members))
+
+    async def _on_invalidate(self, event: dict):
+        self.invalidate_local(event["chat_id"])
+
+
+async def _load_participant_ids(chat_id: int, session=None):
+    from app.chat.dao import ChatsDAO
+    return await ChatsDAO.get_participant_ids(chat_id, session=session)
+
+
+chat_membership = ChatMembershipIndex(
+    loader=_load_participant_ids,
+    broker=broker,
+    max_members=settings.CHAT_MEMBERSHIP_CACHE_MAX_MEMBERS,
+)
+
+Gauge("chat_membership_cache_chats", "Chats in the membership index", lambda: len(chat_membership._chats))
+Gauge("chat_membership_cache_members", "Membership index size in participants", lambda: chat_membership._size)
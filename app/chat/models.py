@@ -1,14 +1,48 @@
-from sqlalchemy import Integer, Text, ForeignKey, Table, Column
+from datetime import datetime
+from sqlalchemy import Integer, Text, ForeignKey, Table, Column, Index, DateTime, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
-from typing import List
+from typing import List, Optional
 
 # Таблица для связи многие-ко-многим между пользователями и чатами
 chat_participants = Table(
     'chat_participants',
     Base.metadata,
-    Column('chat_id', Integer, ForeignKey('chats.id')),
-    Column('user_id', Integer, ForeignKey('users.id'))
+    Column('chat_id', Integer, ForeignKey('chats.id'), primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
+    # ID последнего прочитанного сообщения: непрочитанные — сообщения чата с большим ID
+    Column('last_read_message_id', Integer, nullable=True),
+    # Список чатов пользователя: WHERE user_id = ?
+    Index('ix_chat_participants_user_id', 'user_id')
+)
+
+# Журнал событий чата, кроме новых сообщений: у сообщения seq хранится в нем самом.
+# Вместе с messages.seq дает последовательность seq чата без пропусков — по ней клиент досылает пропущенное
+chat_events = Table(
+    'chat_events',
+    Base.metadata,
+    Column('chat_id', Integer, ForeignKey('chats.id'), primary_key=True),
+    Column('seq', Integer, primary_key=True),
+    # edit / delete — message_id; join — user_id
+    Column('type', Text, nullable=False),
+    Column('message_id', Integer, nullable=True),
+    Column('user_id', Integer, nullable=True),
+    Column('created_at', DateTime, server_default=func.now())
+)
+
+# Клиентские ID сообщений, отправленных пачкой по WebSocket: повтор с тем же ID не создает второе сообщение.
+# Отдельная таблица, потому что уникальный индекс партиционированной messages обязан включать created_at
+client_messages = Table(
+    'client_messages',
+    Base.metadata,
+    Column('sender_id', Integer, ForeignKey('users.id'), primary_key=True),
+    Column('client_id', Text, primary_key=True),
+    Column('chat_id', Integer, nullable=False),
+    Column('message_id', Integer, nullable=False),
+    Column('seq', Integer, nullable=True),
+    Column('created_at', DateTime, server_default=func.now()),
+    # Очистка старых ID: WHERE created_at < ?
+    Index('ix_client_messages_created_at', 'created_at')
 )
 
 
@@ -18,6 +52,13 @@ class Chat(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(Text, nullable=True)
 
+    # Денормализованные поля для списка чатов, обновляются при добавлении сообщений и участников
+    last_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    last_message_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    participant_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    # Последний выданный seq событий чата (сообщения, правки, удаления, участники)
+    last_seq: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+
     # created_at и updated_at уже есть в Base, не переопределяем
 
     # Связи
@@ -34,12 +75,24 @@ class Chat(Base):
 
 
 class Message(Base):
+    # В Postgres таблица разбита на помесячные партиции по created_at (миграция 005, app/chat/partitions.py)
+    # с первичным ключом (id, created_at); для ORM сообщение по-прежнему однозначно определяется id
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Keyset-пагинация истории: WHERE chat_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at, id
+        Index('ix_messages_chat_id_created_at_id', 'chat_id', 'created_at', 'id'),
+        # Счетчик непрочитанных: WHERE chat_id = ? AND id > last_read_message_id
+        Index('ix_messages_chat_id_id', 'chat_id', 'id'),
+        # Досылка пропущенного: WHERE chat_id = ? AND seq > ? ORDER BY seq
+        Index('ix_messages_chat_id_seq', 'chat_id', 'seq'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     chat_id: Mapped[int] = mapped_column(Integer, ForeignKey("chats.id"))
     sender_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
     content: Mapped[str] = mapped_column(Text)
+    # Номер события чата; у сообщений, созданных до миграции 007, проставлен ею
+    seq: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     # created_at и updated_at уже есть в Base, не переопределяем
 
@@ -0,0 +1,194 @@
+"""Помесячные партиции messages (Postgres) и перенос старых партиций в архивные сегменты.
+
+Таблицу делит на партиции миграция 005. Здесь — создание партиций наперед (при старте приложения)
+и архивация: партиции старше MESSAGES_HOT_MONTHS полных месяцев выгружаются в сегменты архива
+и удаляются из БД. Заодно удаляются клиентские ID сообщений старше CLIENT_MESSAGE_IDS_RETENTION_DAYS.
+Архивацию запускают по расписанию, не из воркеров приложения:
+    python -m app.chat.partitions
+    python -m app.chat.partitions --hot-months 12 --dry-run
+"""
+import argparse
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from app.chat.archive import message_archive
+from app.chat.dao import MessagesDAO
+from app.config import settings
+from app.database import engine
+
+PARTITION_NAME = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month() -> date:
+    return month_start(datetime.now(timezone.utc).date())
+
+
+def partition_name(month: date) -> str:
+    return f"messages_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def month_bound(month: date) -> datetime:
+    """Граница партиции — полночь первого числа по UTC"""
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def is_partitioned(connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages')")
+    ).first() is not None
+
+
+def list_partitions(connection) -> List[date]:
+    """Месяцы существующих помесячных партиций (без партиции по умолчанию)"""
+    names = connection.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('messages')
+    """)).scalars()
+    return sorted(month for month in map(partition_month, names) if month is not None)
+
+
+def ensure_message_partitions(connection, months_ahead: int = settings.MESSAGES_PARTITIONS_AHEAD):
+    """Создать партиции текущего месяца и months_ahead следующих, если их еще нет.
+
+    Без партиции новые сообщения попали бы в messages_default, а из нее их придется переносить вручную:
+    партицию на месяц, строки которого уже лежат в default, Postgres не создаст.
+    """
+    if not is_partitioned(connection):
+        return
+    month = current_month()
+    for _ in range(months_ahead + 1):
+        name = partition_name(month)
+        start, end = month_bound(month), month_bound(add_months(month, 1))
+        try:
+            # Несколько воркеров стартуют одновременно — ошибку одной партиции не даем сорвать старт
+            with connection.begin_nested():
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+        except DBAPIError as e:
+            logging.error(f"Could not create partition {name}: {e}")
+        month = add_months(month, 1)
+
+
+# Чаты, последнее сообщение которых ушло в архив: теперь последнее — самое новое из оставшихся в БД.
+# Если в БД сообщений чата не осталось, время последнего сообщения сохраняется для порядка списка чатов
+REPLACE_ARCHIVED_LAST_MESSAGES = """
+    UPDATE chats SET
+        last_message_id = latest.id,
+        last_message_at = coalesce(latest.created_at, chats.last_message_at)
+    FROM chats AS affected
+    LEFT JOIN LATERAL (
+        SELECT id, created_at FROM messages WHERE messages.chat_id = affected.id ORDER BY id DESC LIMIT 1
+    ) AS latest ON true
+    WHERE chats.id = affected.id AND affected.id = ANY(:chat_ids) AND chats.last_message_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM messages WHERE messages.id = chats.last_message_id)
+"""
+
+
+async def archive_partition(month: date) -> int:
+    """Выгрузить партицию в сегмент архива и удалить ее из БД. Возвращает число сообщений.
+
+    В индекс сегмента попадает наибольший seq каждого чата среди его сообщений и событий над ними:
+    досылка через WebSocket дальше него не заглядывает (app/chat/resume.py).
+    """
+    name = partition_name(month)
+    writer = message_archive.writer(name)
+    try:
+        async with engine.begin() as conn:
+            # Запрещаем изменения строк партиции, пока она выгружается
+            await conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+            result = await conn.stream(text(
+                f"SELECT chat_id, id, sender_id, content, created_at, seq FROM {name} "
+                f"ORDER BY chat_id, created_at, id"
+            ))
+            async for chat_id, message_id, sender_id, content, created_at, seq in result:
+                writer.add(chat_id, message_id, sender_id, content, created_at, seq)
+            # Правки архивных сообщений: событие позже самого сообщения, а без сообщения его не дослать
+            result = await conn.execute(text(f"""
+                SELECT chat_events.chat_id, max(chat_events.seq) FROM chat_events
+                JOIN {name} AS archived ON archived.id = chat_events.message_id
+                    AND archived.chat_id = chat_events.chat_id
+                GROUP BY chat_events.chat_id
+            """))
+            for chat_id, seq in result.all():
+                writer.cover_seq(chat_id, seq)
+            writer.close(month_bound(month), month_bound(add_months(month, 1)))
+            # Сегмент уже на диске: если удаление не зафиксируется, строки будут и там, и там —
+            # чтение истории это переживает, а следующий запуск перезапишет сегмент
+            await conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+    except BaseException:
+        writer.abort()
+        raise
+    # Отдельной транзакцией: отправитель держит строку своего чата, пока ждет messages, а DETACH блокирует ее
+    # целиком — в одной транзакции это взаимоблокировка. До этого UPDATE список чатов просто не покажет превью
+    async with engine.begin() as conn:
+        await conn.execute(text(REPLACE_ARCHIVED_LAST_MESSAGES), {"chat_ids": writer.chat_ids})
+    logging.info(f"Archived partition {name}: {writer.count} messages to {writer.path}")
+    return writer.count
+
+
+async def archive_expired_partitions(hot_months: int = settings.MESSAGES_HOT_MONTHS,
+                                     dry_run: bool = False) -> List[str]:
+    """Архивировать партиции, целиком лежащие раньше hot_months полных месяцев до текущего"""
+    cutoff = add_months(current_month(), -hot_months)
+    async with engine.connect() as conn:
+        if not await conn.run_sync(is_partitioned):
+            logging.info("messages is not partitioned, nothing to archive")
+            return []
+        months = await conn.run_sync(list_partitions)
+
+    archived = []
+    for month in months:
+        if month >= cutoff:
+            continue
+        if not dry_run:
+            await archive_partition(month)
+        archived.append(partition_name(month))
+    return archived
+
+
+async def main(hot_months: int, months_ahead: int, dry_run: bool):
+    try:
+        if not dry_run:
+            async with engine.begin() as conn:
+                await conn.run_sync(ensure_message_partitions, months_ahead)
+        archived = await archive_expired_partitions(hot_months, dry_run=dry_run)
+        print(f"{'Would archive' if dry_run else 'Archived'}: {', '.join(archived) or 'nothing'}")
+        if not dry_run:
+            # Клиентские ID пакетной отправки нужны только на время повторов — их чистит та же плановая задача
+            cutoff = datetime.now(timezone.utc) - timedelta(days=settings.CLIENT_MESSAGE_IDS_RETENTION_DAYS)
+            print(f"Pruned client message ids: {await MessagesDAO.prune_client_ids(cutoff)}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hot-months", type=int, default=settings.MESSAGES_HOT_MONTHS)
+    parser.add_argument("--ahead", type=int, default=settings.MESSAGES_PARTITIONS_AHEAD)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.hot_months, args.ahead, args.dry_run))
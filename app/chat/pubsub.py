@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+Handler = Callable[[dict], Awaitable[None]]
+
+# Postgres ограничивает payload NOTIFY 8000 байтами
+PG_NOTIFY_MAX_PAYLOAD = 7999
+# Сколько NOTIFY уходит в Postgres одним executemany
+PG_NOTIFY_BATCH = 100
+
+
+class PayloadTooLargeError(ValueError):
+    pass
+
+
+class BaseBroker:
+    """Pub/sub между воркерами: событие, опубликованное в канал, получает каждый воркер (включая отправителя).
+
+    Обработчики получают общий для всех подписчиков dict и не должны его изменять.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers[channel].append(handler)
+
+    async def publish(self, channel: str, payload: dict):
+        raise NotImplementedError
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def _dispatch(self, channel: str, payload: dict):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                await handler(payload)
+            except Exception as e:
+                logging.error(f"Pub/sub handler for channel {channel} failed: {e}")
+
+
+class LocalBus:
+    """Общая шина для нескольких InMemoryBroker — имитирует несколько воркеров в одном процессе (для тестов)"""
+
+    def __init__(self):
+        self.brokers: List["InMemoryBroker"] = []
+
+    async def publish(self, channel: str, payload: dict):
+        for broker in list(self.brokers):
+            await broker._dispatch(channel, payload)
+
+
+class InMemoryBroker(BaseBroker):
+    """Доставка внутри одного процесса, без сериализации. Достаточно, когда запущен единственный воркер"""
+
+    def __init__(self, bus: Optional[LocalBus] = None):
+        super().__init__()
+        self.bus = bus or LocalBus()
+        self.bus.brokers.append(self)
+
+    async def publish(self, channel: str, payload: dict):
+        await self.bus.publish(channel, payload)
+
+    async def stop(self):
+        if self in self.bus.brokers:
+            self.bus.brokers.remove(self)
+
+
+class PostgresBroker(BaseBroker):
+    """Доставка между воркерами и нодами через Postgres LISTEN/NOTIFY.
+
+    NOTIFY идут через то же выделенное подключение, что и LISTEN, а не через пул приложения:
+    всплеск сообщений не конкурирует за подключения с запросами. Публикации копятся в очереди
+    и уходят пачками по PG_NOTIFY_BATCH в порядке публикации.
+    """
+
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0):
+        super().__init__()
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self._conn = None
+        # asyncpg не выполняет на одном подключении две операции сразу: LISTEN и NOTIFY идут по очереди
+        self._conn_lock = asyncio.Lock()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._outbox: "asyncio.Queue[Tuple[str, str, asyncio.Future]]" = asyncio.Queue()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._notifier: Optional[asyncio.Task] = None
+        self._reconnector: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def subscribe(self, channel: str, handler: Handler):
+        is_new = channel not in self._handlers
+        super().subscribe(channel, handler)
+        if is_new and self._conn is not None:
+            asyncio.get_running_loop().create_task(self._add_listener(channel))
+
+    async def publish(self, channel: str, payload: dict):
+        raw = json.dumps(payload)
+        if len(raw.encode()) > PG_NOTIFY_MAX_PAYLOAD:
+            raise PayloadTooLargeError(f"Payload for channel {channel} exceeds NOTIFY limit")
+        future = asyncio.get_running_loop().create_future()
+        self._outbox.put_nowait((channel, raw, future))
+        await future
+
+    async def start(self):
+        self._stopping = False
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        self._notifier = asyncio.create_task(self._notify_loop())
+        await self._listen()
+
+    async def stop(self):
+        self._stopping = True
+        for task in (self._reconnector, self._dispatcher, self._notifier):
+            if task:
+                task.cancel()
+        while not self._outbox.empty():
+            _, _, future = self._outbox.get_nowait()
+            if not future.done():
+                future.set_exception(ConnectionError("Pub/sub broker stopped"))
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+    async def _listen(self):
+        import asyncpg
+
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_terminated)
+        for channel in list(self._handlers):
+            await conn.add_listener(channel, self._on_notify)
+        self._conn = conn
+        logging.info(f"Pub/sub listening on {len(self._handlers)} Postgres channel(s)")
+
+    async def _add_listener(self, channel: str):
+        async with self._conn_lock:
+            await self._conn.add_listener(channel, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        # Коллбэк asyncpg синхронный: складываем в очередь, чтобы сохранить порядок событий
+        self._queue.put_nowait((channel, payload))
+
+    def _on_terminated(self, connection):
+        if connection is self._conn:
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        """Переподключиться и заново подписаться на каналы; повторный вызов во время переподключения ничего не делает"""
+        if self._stopping or (self._reconnector is not None and not self._reconnector.done()):
+            return
+        logging.error("Pub/sub LISTEN connection lost, reconnecting")
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            conn.terminate()
+        self._reconnector = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopping:
+            try:
+                await self._listen()
+                return
+            except Exception as e:
+                logging.error(f"Pub/sub reconnect failed: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _notify_loop(self):
+        while True:
+            batch = [await self._outbox.get()]
+            while len(batch) < PG_NOTIFY_BATCH and not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    raise ConnectionError("Pub/sub connection is not available")
+                async with self._conn_lock:
+                    await self._conn.executemany("SELECT pg_notify($1, $2)",
+                                                 [(channel, raw) for channel, raw, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if self._is_connection_error(e):
+                    self._schedule_reconnect()
+                continue
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    def _is_connection_error(self, error: Exception) -> bool:
+        import asyncpg
+
+        if self._conn is None or self._conn.is_closed():
+            return True
+        return isinstance(error, (OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError))
+
+    async def _dispatch_loop(self):
+        while True:
+            channel, raw = await self._queue.get()
+            await self._dispatch(channel, json.loads(raw))
+
+
+def create_broker() -> BaseBroker:
+    if settings.PUBSUB_BACKEND == "postgres":
+        from app.database import engine
+
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresBroker(dsn=dsn)
+    return InMemoryBroker()
+
+
+broker = create_broker()
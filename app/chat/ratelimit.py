@@ -0,0 +1,126 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+from app.config import settings
+from app.metrics import Counter
+
+throttled_frames = Counter("ws_throttled_frames_total", "Inbound WebSocket frames rejected by rate limits", ["scope"])
+throttle_disconnects = Counter("ws_throttle_disconnects_total", "WebSocket connections closed for staying over the limit")
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst подряд. Токены пересчитываются лениво при обращении.
+
+    rate <= 0 — ведро не пополняется: после burst токенов take() всегда отказывает (с бесконечным ожиданием).
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, now: float = None) -> float:
+        """Взять токен. 0 — взят; иначе через сколько секунд он появится"""
+        now = time.monotonic() if now is None else now
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class RateLimiter:
+    """Token bucket на ключ (пользователь, чат) в памяти воркера.
+
+    Ведра хранятся в LRU ограниченного размера: отсутствующее или вытесненное ведро считается полным.
+    rate <= 0 отключает ограничение.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def acquire(self, key: Hashable, now: float = None) -> float:
+        """Взять токен для key. 0 — можно; иначе через сколько секунд повторить"""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+user_limiter = RateLimiter(settings.WS_USER_MESSAGES_PER_SECOND, settings.WS_USER_BURST,
+                           settings.WS_RATE_LIMIT_MAX_KEYS)
+chat_limiter = RateLimiter(settings.WS_CHAT_MESSAGES_PER_SECOND, settings.WS_CHAT_BURST,
+                           settings.WS_RATE_LIMIT_MAX_KEYS)
+
+
+class ConnectionThrottle:
+    """Входящие кадры одного WebSocket-подключения: лимит пользователя на любой кадр, лимит чата на сообщения.
+
+    Отклоненный кадр — нарушение. Нарушения копятся в своем ведре (WS_THROTTLE_MAX_VIOLATIONS подряд,
+    прощаются со скоростью WS_THROTTLE_VIOLATIONS_DECAY в секунду); когда оно пустеет, подключение
+    нужно закрыть. Все проверки — O(1) в памяти, без обращений к БД.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.violations = TokenBucket(settings.WS_THROTTLE_VIOLATIONS_DECAY, settings.WS_THROTTLE_MAX_VIOLATIONS)
+        self.exceeded = False
+
+    def check_frame(self) -> Optional[dict]:
+        """Вызвать на каждый входящий кадр. None — кадр можно обрабатывать, иначе ответ клиенту"""
+        return self._check("user", user_limiter.acquire(self.user_id))
+
+    def check_message(self, chat_id: int) -> Optional[dict]:
+        """Вызвать перед записью сообщения в чат"""
+        rejection = self._check("chat", chat_limiter.acquire(chat_id))
+        if rejection is not None:
+            rejection['chat_id'] = chat_id
+        return rejection
+
+    def check_batch(self, chat_ids: List[int]) -> List[float]:
+        """check_message для пачки сообщений по порядку: 0 — можно писать, иначе через сколько секунд повторить.
+
+        После первого отказа в чате отклоняются и следующие сообщения этого чата, чтобы повтор
+        не переставил их местами. Нарушение засчитывается одно на пачку, а не на сообщение.
+        """
+        blocked: Dict[int, float] = {}
+        delays = []
+        for chat_id in chat_ids:
+            retry_after = blocked.get(chat_id) or chat_limiter.acquire(chat_id)
+            if retry_after:
+                blocked[chat_id] = retry_after
+            delays.append(retry_after)
+        rejected = sum(1 for retry_after in delays if retry_after)
+        if rejected:
+            throttled_frames.inc(rejected, "chat")
+            self._violation()
+        return delays
+
+    def _check(self, scope: str, retry_after: float) -> Optional[dict]:
+        if not retry_after:
+            return None
+        throttled_frames.inc(1, scope)
+        self._violation()
+        return {'type': 'throttled', 'scope': scope, 'retry_after': round(retry_after, 3)}
+
+    def _violation(self):
+        if self.violations.take() and not self.exceeded:
+            self.exceeded = True
+            throttle_disconnects.inc()
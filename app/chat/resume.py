@@ -0,0 +1,69 @@
+import asyncio
+from typing import Dict, List, Union
+from app.chat.archive import message_archive
+from app.chat.dao import ChatsDAO, MessagesDAO
+from app.config import settings
+from app.database import async_session_maker
+from app.metrics import SIZE_BUCKETS, Counter, Histogram
+
+resumed_chats = Counter("ws_resume_chats_total", "Chats in WebSocket resume requests by outcome", ["result"])
+replayed_events = Histogram("ws_resume_replayed_events", "Events replayed for one chat on resume", buckets=SIZE_BUCKETS)
+
+# После деплоя переподключаются все клиенты сразу: досылки воркера не занимают больше этого числа подключений к БД
+_slots = asyncio.Semaphore(settings.WS_RESUME_CONCURRENCY)
+
+
+def parse_positions(value: Union[str, dict, None]) -> Dict[int, int]:
+    """Позиции клиента: "chat_id:seq,chat_id:seq" из URL или {chat_id: seq} из кадра resume.
+
+    Некорректные пары пропускаются.
+    """
+    if isinstance(value, dict):
+        pairs = value.items()
+    elif isinstance(value, str):
+        pairs = (pair.partition(":")[::2] for pair in value.split(","))
+    else:
+        return {}
+    positions = {}
+    for chat_id, seq in pairs:
+        try:
+            positions[int(chat_id)] = max(int(seq), 0)
+        except (TypeError, ValueError):
+            continue
+        if len(positions) >= settings.WS_RESUME_MAX_CHATS:
+            break
+    return positions
+
+
+async def resume_frames(user_id: int, positions: Dict[int, int]) -> List[dict]:
+    """Кадры досылки для позиций клиента {chat_id: последний виденный seq}.
+
+    replay — события после позиции до seq кадра включительно (пропуски в них — удаленные сообщения);
+    resync — пропущено больше WS_RESUME_MAX_EVENTS событий, историю чата клиенту дешевле перечитать,
+    или часть пропущенного уже в архиве: из БД ее не дослать, а история чата читает и архив.
+    Чаты, где клиент не отстал или не состоит, не дают кадров и запросов к событиям.
+    """
+    if not positions:
+        return []
+    frames = []
+    async with _slots, async_session_maker() as session:
+        # Сначала последние seq: все события до них уже зафиксированы, и их перечитает следующий запрос
+        last_seqs = await ChatsDAO.get_last_seqs(user_id, positions, session=session)
+        for chat_id, last_seq in last_seqs.items():
+            since = positions[chat_id]
+            if since == last_seq:
+                resumed_chats.inc(1, "up_to_date")
+                continue
+            if since > last_seq or last_seq - since > settings.WS_RESUME_MAX_EVENTS:
+                resumed_chats.inc(1, "resync")
+                frames.append({'type': 'resync', 'chat_id': chat_id})
+                continue
+            if since < message_archive.archived_seq(chat_id):
+                resumed_chats.inc(1, "archived")
+                frames.append({'type': 'resync', 'chat_id': chat_id})
+                continue
+            events = await MessagesDAO.get_chat_events(chat_id, since, last_seq, session=session)
+            resumed_chats.inc(1, "replayed")
+            replayed_events.observe(len(events))
+            frames.append({'type': 'replay', 'chat_id': chat_id, 'seq': last_seq, 'events': events})
+    return frames
@@ -1,118 +1,288 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Request, Depends, HTTPException, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import (APIRouter, WebSocket, WebSocketDisconnect, Request, Response, Depends, HTTPException, Form,
+                     Query, Header)
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from typing import List, Dict
+from starlette.background import BackgroundTask
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.chat.dao import ChatsDAO, MessagesDAO
-from app.chat.schemas import ChatCreate, ChatRead, MessageRead, MessageCreate
-from app.users.dao import UsersDAO
-from app.users.dependencies import get_current_user
-from app.users.models import User
-import json
+from app.chat.manager import Connection, EventStreamConnection, manager
+from app.chat.membership import chat_membership
+from app.chat.ratelimit import ConnectionThrottle
+from app.chat.resume import parse_positions, resume_frames
+from app.chat.schemas import (ChatCreate, ChatRead, ChatMarkRead, MessageRead, MessageCreate, MessageEdit,
+                              MessageSync, MessageSearchResults)
+from app.chat.versions import chat_list_versions
+from app.assets import static_assets
+from app.config import settings
+from app.database import get_session
+from app.etags import etag_matches, not_modified, set_etag
+from app.users.dependencies import get_current_user, get_user_by_token
+from app.users.schemas import SCurrentUser
+import asyncio
 import logging
 
 router = APIRouter(prefix='/chat', tags=['Chat'])
 templates = Jinja2Templates(directory='app/templates')
+templates.env.globals['asset_url'] = static_assets.url
 
-# Активные WebSocket-подключения: {user_id: websocket}
-active_connections: Dict[int, WebSocket] = {}
-
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logging.info(f"User {user_id} connected. Active connections: {len(self.active_connections)}")
-
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logging.info(f"User {user_id} disconnected. Active connections: {len(self.active_connections)}")
-
-    async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-            except Exception as e:
-                logging.error(f"Error sending message to user {user_id}: {e}")
-                self.disconnect(user_id)
-
-    async def broadcast_to_chat(self, chat_id: int, message: dict, exclude_user_id: int = None):
-        """Отправить сообщение всем участникам чата"""
-        chat = await ChatsDAO.find_one_or_none_by_id(chat_id)
-        if not chat:
-            return
-
-        for user in chat.participants:
-            if user.id != exclude_user_id and user.id in self.active_connections:
-                await self.send_personal_message(message, user.id)
-
-
-manager = ConnectionManager()
+# Код закрытия WebSocket: нарушение политики (нет авторизации, превышен лимит)
+WS_POLICY_VIOLATION = 1008
 
 
 @router.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    await manager.connect(websocket, user_id)
+    # Браузер присылает cookie авторизации и при открытии WebSocket: без нее лимиты на пользователя
+    # и проверка участия в чате ничего бы не стоили
+    token = websocket.cookies.get('users_access_token')
+    try:
+        if not token:
+            raise HTTPException(status_code=401)
+        current_user = await get_user_by_token(token)
+    except HTTPException:
+        await websocket.close(code=WS_POLICY_VIOLATION)
+        return
+    if current_user.id != user_id:
+        await websocket.close(code=WS_POLICY_VIOLATION)
+        return
+
+    # ?resume=chat_id:seq,... — последние seq, которые клиент видел до обрыва: досылаем только пропущенное
+    positions = parse_positions(websocket.query_params.get('resume'))
+
+    async def replay(connection):
+        for frame in await resume_frames(user_id, positions):
+            await connection.send_now(frame)
+
+    connection = await manager.connect(websocket, user_id, replay=replay if positions else None)
+    throttle = ConnectionThrottle(user_id)
     try:
         while True:
-            data = await websocket.receive_text()
-            try:
-                message_data = json.loads(data)
-
-                if message_data.get('type') == 'message':
+            data = await connection.receive()
+            # Лимиты проверяются до разбора кадра и до любых обращений к БД
+            rejection = throttle.check_frame()
+            if rejection is None:
+                try:
+                    message_data = connection.codec.decode(data)
+                except ValueError:
+                    connection.send_json({'error': connection.codec.invalid_frame_error})
+                    continue
+
+                if message_data.get('type') == 'resume':
+                    # Клиент заметил пропуск в seq посреди сессии
+                    for frame in await resume_frames(user_id, parse_positions(message_data.get('chats'))):
+                        connection.send_json(frame)
+
+                elif message_data.get('type') == 'batch':
+                    await handle_websocket_batch(current_user, connection, throttle, message_data.get('ops'))
+
+                elif message_data.get('type') == 'message' and 'client_id' in message_data:
+                    # Сообщение с клиентским ID — пачка из одной операции: с ack и защитой от повторов
+                    await handle_websocket_batch(current_user, connection, throttle, [message_data])
+
+                elif message_data.get('type') == 'message':
                     chat_id = message_data.get('chat_id')
                     content = message_data.get('content')
-
-                    if chat_id and content:
-                        # Сохраняем сообщение в БД
-                        message = await MessagesDAO.add_message(
-                            chat_id=chat_id,
-                            sender_id=user_id,
-                            content=content
-                        )
-
-                        # Получаем информацию об отправителе
-                        sender = await UsersDAO.find_one_or_none_by_id(user_id)
-
-                        # Отправляем сообщение всем участникам чата
-                        response_data = {
-                            'type': 'message',
-                            'id': message.id,
-                            'chat_id': chat_id,
-                            'sender_id': user_id,
-                            'sender_name': sender.name if sender else f"User{user_id}",
-                            'content': content,
-                            'created_at': message.created_at.isoformat()
-                        }
-
-                        await manager.broadcast_to_chat(chat_id, response_data, exclude_user_id=user_id)
-                        # Также отправляем обратно отправителю для подтверждения
-                        await manager.send_personal_message(user_id, response_data)
-
-            except json.JSONDecodeError:
-                await websocket.send_json({'error': 'Invalid JSON'})
+                    if not _is_message(chat_id, content):
+                        connection.send_json({'error': 'Invalid operation'})
+                        continue
+                    # Участие в чате — из кэша членства: в чужой чат писать (и тратить его лимит) нельзя
+                    if not await chat_membership.is_participant(chat_id, user_id):
+                        connection.send_json({'error': 'Chat not found', 'chat_id': chat_id})
+                        continue
+                    rejection = throttle.check_message(chat_id)
+                    if rejection is None:
+                        await handle_websocket_message(current_user, chat_id, content)
+
+            if rejection is not None:
+                connection.send_json(rejection)
+                if throttle.exceeded:
+                    logging.warning(f"Closing WebSocket of user {user_id}: stayed over the rate limit")
+                    await connection.close(code=WS_POLICY_VIOLATION)
+                    break
 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
+    finally:
+        manager.disconnect(connection)
 
 
-@router.get("/", response_class=HTMLResponse, summary="Chat Page")
-async def get_chat_page(request: Request, current_user: User = Depends(get_current_user)):
-    # Получаем чаты пользователя и всех пользователей для создания новых чатов
-    user_chats = await ChatsDAO.get_user_chats(current_user.id)
-    all_users = await UsersDAO.find_all()
+async def handle_websocket_message(current_user: SCurrentUser, chat_id: int, content: str):
+    # Сохраняем сообщение в БД
+    message = await MessagesDAO.add_message(
+        chat_id=chat_id,
+        sender_id=current_user.id,
+        content=content,
+        sender_name=current_user.name
+    )
+
+    # Отправляем сообщение всем участникам чата
+    response_data = {
+        'type': 'message',
+        'id': message.id,
+        'chat_id': chat_id,
+        'seq': message.seq,
+        'sender_id': current_user.id,
+        'sender_name': current_user.name,
+        'content': content,
+        'created_at': message.created_at.isoformat()
+    }
+
+    await manager.broadcast_to_chat(chat_id, response_data, exclude_user_id=current_user.id)
+    # Также отправляем обратно отправителю для подтверждения
+    await manager.send_personal_message(response_data, current_user.id)
+
+
+def _is_message(chat_id, content) -> bool:
+    """chat_id и content из кадра клиента: целый ID чата (bool в JSON — не число) и непустой текст"""
+    return isinstance(chat_id, int) and not isinstance(chat_id, bool) and isinstance(content, str) and bool(content)
+
+
+def _batch_op_error(op) -> Optional[str]:
+    if not isinstance(op, dict) or op.get('type', 'message') != 'message':
+        return 'Invalid operation'
+    client_id, chat_id, content = op.get('client_id'), op.get('chat_id'), op.get('content')
+    if not isinstance(client_id, str) or not 0 < len(client_id) <= settings.WS_CLIENT_ID_MAX_LENGTH:
+        return 'Invalid client_id'
+    if not _is_message(chat_id, content):
+        return 'Invalid operation'
+    return None
+
+
+async def handle_websocket_batch(current_user: SCurrentUser, connection: Connection, throttle: ConnectionThrottle,
+                                 ops: Optional[list]):
+    """Пачка сообщений с клиентскими ID, например очередь клиента, копившаяся офлайн.
+
+    Ответ — один кадр {'type': 'ack', 'acks': [...]} с результатом каждой операции по порядку: ID, seq
+    и время сообщения или error. Повтор уже записанного client_id подтверждается исходным сообщением
+    с duplicate: true, поэтому клиент может смело переотправлять все, на что не получил ack.
+    """
+    if not isinstance(ops, list) or not 0 < len(ops) <= settings.WS_BATCH_MAX_OPS:
+        connection.send_json({'error': f'Batch must have 1 to {settings.WS_BATCH_MAX_OPS} operations'})
+        return
+
+    results: List[Optional[dict]] = [None] * len(ops)
+    accepted = []
+    member_of = {}
+    for i, op in enumerate(ops):
+        error = _batch_op_error(op)
+        if error is not None:
+            client_id = op.get('client_id') if isinstance(op, dict) else None
+            results[i] = {'client_id': client_id if isinstance(client_id, str) else None, 'error': error}
+            continue
+        if op['chat_id'] not in member_of:
+            member_of[op['chat_id']] = await chat_membership.is_participant(op['chat_id'], current_user.id)
+        if not member_of[op['chat_id']]:
+            results[i] = {'client_id': op['client_id'], 'error': 'Chat not found'}
+            continue
+        accepted.append(i)
+
+    # Повтор уже записанной операции тоже тратит лимит чата: проверить это можно только в БД
+    delays = throttle.check_batch([ops[i]['chat_id'] for i in accepted])
+    for i, retry_after in zip(accepted, delays):
+        if retry_after:
+            results[i] = {'client_id': ops[i]['client_id'], 'error': 'throttled', 'retry_after': round(retry_after, 3)}
+    accepted = [i for i, retry_after in zip(accepted, delays) if not retry_after]
+
+    if accepted:
+        acks, messages = await MessagesDAO.add_client_messages(
+            current_user.id, [ops[i] for i in accepted], sender_name=current_user.name
+        )
+        for i, ack in zip(accepted, acks):
+            results[i] = ack
+
+        # Новые сообщения — всем участникам, включая другие подключения отправителя; по чатам в порядке пачки
+        by_chat = {}
+        for message in messages:
+            by_chat.setdefault(message.chat_id, []).append({
+                'type': 'message',
+                'id': message.id,
+                'chat_id': message.chat_id,
+                'seq': message.seq,
+                'sender_id': current_user.id,
+                'sender_name': current_user.name,
+                'content': message.content,
+                'created_at': message.created_at.isoformat()
+            })
+        for chat_id, events in by_chat.items():
+            await manager.broadcast_many_to_chat(chat_id, events)
+
+    connection.send_json({'type': 'ack', 'acks': results})
+
+
+@router.get("/events", summary="Server-Sent Events")
+async def event_stream(last_event_id: Optional[int] = Header(None),
+                       current_user: SCurrentUser = Depends(get_current_user),
+                       session: AsyncSession = Depends(get_session)):
+    """Поток событий чатов пользователя (SSE) — односторонняя замена WebSocket.
+
+    После переподключения браузер присылает Last-Event-ID — пропущенные сообщения досылаются из БД.
+    """
+    # Подписываемся до чтения пропущенного, чтобы не потерять сообщения между чтением и подпиской
+    connection = manager.connect_event_stream(current_user.id)
+    missed = []
+    try:
+        if last_event_id is not None:
+            missed = await MessagesDAO.get_user_messages_since(current_user.id, last_event_id,
+                                                               settings.SSE_REPLAY_LIMIT + 1, session=session)
+    except Exception:
+        manager.disconnect(connection)
+        raise
+    finally:
+        # Поток живет долго — подключение к БД ему не нужно
+        await session.close()
+
+    async def body():
+        try:
+            yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+            last_sent_id = last_event_id
+            if len(missed) > settings.SSE_REPLAY_LIMIT:
+                # Пропущено слишком много — клиент перечитает историю сам
+                yield EventStreamConnection.encode({'type': 'resync'})
+            else:
+                for message in missed:
+                    yield EventStreamConnection.encode({
+                        'type': 'message',
+                        'id': message.id,
+                        'chat_id': message.chat_id,
+                        'seq': message.seq,
+                        'sender_id': message.sender_id,
+                        'sender_name': message.sender.name,
+                        'content': message.content,
+                        'created_at': message.created_at.isoformat()
+                    })
+                    last_sent_id = message.id
+
+            async for frame in connection.frames(settings.SSE_HEARTBEAT_SECONDS):
+                # То, что успело прийти и в очередь, и в досылку, отдаем один раз
+                event_id = EventStreamConnection.event_id(frame)
+                if last_sent_id is not None and event_id is not None and event_id <= last_sent_id:
+                    continue
+                yield frame
+        finally:
+            manager.disconnect(connection)
+
+    async def release():
+        # Если клиент ушел до первого кадра, генератор не запускался и finally выше не выполнится
+        manager.disconnect(connection)
+
+    return StreamingResponse(body(), media_type="text/event-stream", background=BackgroundTask(release), headers={
+        "Cache-Control": "no-cache",
+        # Не буферизовать поток на nginx
+        "X-Accel-Buffering": "no",
+    })
 
-    # Исключаем текущего пользователя из списка
-    other_users = [user for user in all_users if user.id != current_user.id]
+
+@router.get("/", response_class=HTMLResponse, summary="Chat Page")
+async def get_chat_page(request: Request, current_user: SCurrentUser = Depends(get_current_user),
+                        session: AsyncSession = Depends(get_session)):
+    # Пользователей для нового чата страница ищет сама через /auth/users — их число на рендер не влияет
+    user_chats = await ChatsDAO.get_user_chats(current_user.id, session=session)
 
     return templates.TemplateResponse("chat.html", {
         "request": request,
         "current_user": current_user,
         "user_chats": user_chats,
-        "all_users": other_users
+        "unread_count_cap": settings.UNREAD_COUNT_CAP
     })
 
 
@@ -121,7 +291,8 @@ async def create_chat(
         request: Request,
         chat_name: str = Form(None),
         participant_ids: str = Form(...),
-        current_user: User = Depends(get_current_user)
+        current_user: SCurrentUser = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
 ):
     """Создать новый чат через форму"""
     try:
@@ -135,8 +306,10 @@ async def create_chat(
         # Создаем чат
         new_chat = await ChatsDAO.create_chat(
             name=chat_name,
-            participant_ids=participant_id_list
+            participant_ids=participant_id_list,
+            session=session
         )
+        await session.commit()
 
         return JSONResponse({
             "success": True,
@@ -152,29 +325,61 @@ async def create_chat(
 
 
 @router.get("/chats", response_model=List[ChatRead])
-async def get_user_chats(current_user: User = Depends(get_current_user)):
-    """Получить все чаты пользователя"""
-    chats = await ChatsDAO.get_user_chats(current_user.id)
-    return [{
-        "id": chat.id,
-        "name": chat.name,
-        "created_at": chat.created_at,
-        "participant_count": len(chat.participants)
-    } for chat in chats]
+async def get_user_chats(request: Request, response: Response,
+                         current_user: SCurrentUser = Depends(get_current_user),
+                         session: AsyncSession = Depends(get_session)):
+    """Получить все чаты пользователя с последним сообщением и числом непрочитанных.
+
+    Неизменившийся список — 304 по If-None-Match без обращения к БД.
+    """
+    # Версия берется до запроса: изменение во время чтения даст новый ETag, а не устаревший ответ под новым
+    etag = chat_list_versions.etag(current_user.id)
+    if etag_matches(request, etag):
+        return not_modified(etag, "chats")
+    set_etag(response, etag)
+    return await ChatsDAO.get_user_chats(current_user.id, session=session)
+
+
+@router.post("/chats/{chat_id}/read")
+async def mark_chat_read(chat_id: int, payload: Optional[ChatMarkRead] = None,
+                         current_user: SCurrentUser = Depends(get_current_user),
+                         session: AsyncSession = Depends(get_session)):
+    """Отметить сообщения чата прочитанными"""
+    if not await chat_membership.is_participant(chat_id, current_user.id, session=session):
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    message_id = payload.message_id if payload else None
+    marked = await ChatsDAO.mark_read(chat_id, current_user.id, message_id=message_id, session=session)
+    await session.commit()
+    if marked:
+        await chat_list_versions.changed([current_user.id])
+    return {"success": True}
 
 
 @router.get("/messages/{chat_id}", response_model=List[MessageRead])
-async def get_chat_messages(chat_id: int, current_user: User = Depends(get_current_user)):
-    """Получить сообщения чата"""
+async def get_chat_messages(
+        chat_id: int,
+        before: int = Query(None, description="Вернуть сообщения старше сообщения с этим ID"),
+        after: int = Query(None, description="Вернуть сообщения новее сообщения с этим ID"),
+        limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_PAGE_SIZE_MAX),
+        current_user: SCurrentUser = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """Получить страницу сообщений чата (по умолчанию — последние limit сообщений)"""
     # Проверяем, что пользователь является участником чата
-    chat = await ChatsDAO.find_one_or_none_by_id(chat_id)
-    if not chat or current_user not in chat.participants:
+    if not await chat_membership.is_participant(chat_id, current_user.id, session=session):
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    messages = await MessagesDAO.get_chat_messages(chat_id)
+    if before is None and after is None:
+        # Первая страница — самый частый запрос, отдаем из кэша последних сообщений
+        return await MessagesDAO.get_recent_messages(chat_id, limit, session=session)
+
+    messages = await MessagesDAO.get_chat_messages(chat_id, before_id=before, after_id=after, limit=limit,
+                                                   session=session)
     return [{
         "id": message.id,
         "chat_id": message.chat_id,
+        "seq": message.seq,
         "sender_id": message.sender_id,
         "sender_name": message.sender.name,
         "content": message.content,
@@ -182,28 +387,89 @@ async def get_chat_messages(chat_id: int, current_user: User = Depends(get_curre
     } for message in messages]
 
 
+@router.get("/messages/{chat_id}/sync", response_model=MessageSync)
+async def sync_chat_messages(
+        chat_id: int,
+        since_seq: int = Query(..., ge=0, description="seq последнего сообщения, которое уже есть у клиента"),
+        wait: float = Query(0, ge=0, le=settings.SYNC_WAIT_MAX_SECONDS,
+                            description="Сколько секунд ждать новых сообщений, если их пока нет"),
+        limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_PAGE_SIZE_MAX),
+        current_user: SCurrentUser = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """Получить сообщения с seq больше since_seq; без новых сообщений ждать до wait секунд (long-poll)"""
+    if not await chat_membership.is_participant(chat_id, current_user.id, session=session):
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    with manager.watch_chat(chat_id) as new_message:
+        messages = await MessagesDAO.get_messages_since(chat_id, since_seq, limit + 1, session=session)
+        if not messages and wait:
+            # Во время ожидания не держим подключение из пула
+            await session.close()
+            try:
+                await asyncio.wait_for(new_message, wait)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                messages = await MessagesDAO.get_messages_since(chat_id, since_seq, limit + 1, session=session)
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return {
+        "messages": [{
+            "id": message.id,
+            "chat_id": message.chat_id,
+            "seq": message.seq,
+            "sender_id": message.sender_id,
+            "sender_name": message.sender.name,
+            "content": message.content,
+            "created_at": message.created_at
+        } for message in messages],
+        "next_since_seq": messages[-1].seq if messages else since_seq,
+        "has_more": has_more
+    }
+
+
+@router.get("/search", response_model=MessageSearchResults)
+async def search_messages(
+        q: str = Query(..., min_length=1, max_length=200, description="Слова для поиска"),
+        chat_id: int = Query(None, description="Искать только в этом чате"),
+        limit: int = Query(settings.SEARCH_PAGE_SIZE, ge=1, le=settings.SEARCH_PAGE_SIZE_MAX),
+        offset: int = Query(0, ge=0, le=settings.SEARCH_MAX_CANDIDATES),
+        current_user: SCurrentUser = Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
+):
+    """Полнотекстовый поиск по сообщениям чатов пользователя"""
+    results = await MessagesDAO.search_messages(current_user.id, q, chat_id=chat_id, limit=limit + 1, offset=offset,
+                                                session=session)
+    return {"results": results[:limit], "has_more": len(results) > limit}
+
+
 @router.post("/messages", response_model=MessageRead)
-async def send_message(message: MessageCreate, current_user: User = Depends(get_current_user)):
+async def send_message(message: MessageCreate, current_user: SCurrentUser = Depends(get_current_user),
+                       session: AsyncSession = Depends(get_session)):
     """Отправить сообщение в чат"""
     # Проверяем, что пользователь является участником чата
-    chat = await ChatsDAO.find_one_or_none_by_id(message.chat_id)
-    if not chat or current_user not in chat.participants:
+    if not await chat_membership.is_participant(message.chat_id, current_user.id, session=session):
         raise HTTPException(status_code=404, detail="Chat not found")
 
     new_message = await MessagesDAO.add_message(
         chat_id=message.chat_id,
         sender_id=current_user.id,
-        content=message.content
+        content=message.content,
+        sender_name=current_user.name,
+        session=session
     )
+    await session.commit()
 
     # Отправляем через WebSocket
-    sender = await UsersDAO.find_one_or_none_by_id(current_user.id)
     message_data = {
         'type': 'message',
         'id': new_message.id,
         'chat_id': message.chat_id,
+        'seq': new_message.seq,
         'sender_id': current_user.id,
-        'sender_name': sender.name if sender else f"User{current_user.id}",
+        'sender_name': current_user.name,
         'content': message.content,
         'created_at': new_message.created_at.isoformat()
     }
@@ -213,8 +479,35 @@ async def send_message(message: MessageCreate, current_user: User = Depends(get_
     return {
         "id": new_message.id,
         "chat_id": new_message.chat_id,
+        "seq": new_message.seq,
         "sender_id": new_message.sender_id,
-        "sender_name": sender.name if sender else f"User{current_user.id}",
+        "sender_name": current_user.name,
         "content": new_message.content,
         "created_at": new_message.created_at
-    }
\ No newline at end of file
+    }
+
+
+@router.patch("/messages/{message_id}")
+async def edit_message(message_id: int, payload: MessageEdit, current_user: SCurrentUser = Depends(get_current_user),
+                       session: AsyncSession = Depends(get_session)):
+    """Изменить текст своего сообщения"""
+    event = await MessagesDAO.edit_message(message_id, current_user.id, payload.content, session=session)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    await session.commit()
+
+    await manager.broadcast_to_chat(event['chat_id'], event)
+    return event
+
+
+@router.delete("/messages/{message_id}")
+async def delete_message(message_id: int, current_user: SCurrentUser = Depends(get_current_user),
+                         session: AsyncSession = Depends(get_session)):
+    """Удалить свое сообщение"""
+    event = await MessagesDAO.delete_message(message_id, current_user.id, session=session)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    await session.commit()
+
+    await manager.broadcast_to_chat(event['chat_id'], event)
+    return event
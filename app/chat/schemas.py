@@ -13,11 +13,24 @@ class ChatRead(BaseModel):
     name: Optional[str] = Field(None, description="Название чата")
     created_at: datetime = Field(..., description="Время создания чата")
     participant_count: int = Field(..., description="Количество участников")
+    last_message_id: Optional[int] = Field(None, description="ID последнего сообщения")
+    last_message_at: Optional[datetime] = Field(None, description="Время последнего сообщения")
+    last_message_preview: Optional[str] = Field(None, description="Начало последнего сообщения")
+    last_message_sender_id: Optional[int] = Field(None, description="ID автора последнего сообщения")
+    last_message_sender_name: Optional[str] = Field(None, description="Имя автора последнего сообщения")
+    last_read_message_id: Optional[int] = Field(None, description="ID последнего прочитанного сообщения")
+    unread_count: int = Field(0, description="Количество непрочитанных, не больше UNREAD_COUNT_CAP")
+    unread_overflow: bool = Field(False, description="Непрочитанных больше UNREAD_COUNT_CAP")
+
+
+class ChatMarkRead(BaseModel):
+    message_id: Optional[int] = Field(None, description="ID сообщения; по умолчанию — последнее сообщение чата")
 
 
 class MessageRead(BaseModel):
     id: int = Field(..., description="Уникальный идентификатор сообщения")
     chat_id: int = Field(..., description="ID чата")
+    seq: Optional[int] = Field(None, description="Номер события в чате; нет у архивных сообщений")
     sender_id: int = Field(..., description="ID отправителя сообщения")
     sender_name: str = Field(..., description="Имя отправителя")
     content: str = Field(..., description="Содержимое сообщения")
@@ -26,4 +39,29 @@ class MessageRead(BaseModel):
 
 class MessageCreate(BaseModel):
     chat_id: int = Field(..., description="ID чата")
-    content: str = Field(..., description="Содержимое сообщения")
\ No newline at end of file
+    content: str = Field(..., description="Содержимое сообщения")
+
+
+class MessageEdit(BaseModel):
+    content: str = Field(..., min_length=1, description="Новый текст сообщения")
+
+
+class MessageSync(BaseModel):
+    messages: List[MessageRead] = Field(..., description="Новые сообщения по возрастанию seq")
+    next_since_seq: int = Field(..., description="since_seq для следующего запроса")
+    has_more: bool = Field(..., description="Есть еще сообщения — запросить сразу, без ожидания")
+
+
+class MessageSearchHit(BaseModel):
+    id: int = Field(..., description="ID сообщения")
+    chat_id: int = Field(..., description="ID чата")
+    sender_id: int = Field(..., description="ID отправителя сообщения")
+    sender_name: str = Field(..., description="Имя отправителя")
+    created_at: datetime = Field(..., description="Время отправки сообщения")
+    rank: float = Field(..., description="Релевантность: больше — лучше")
+    snippet: str = Field(..., description="Фрагмент текста; найденные слова между символами \\x02 и \\x03")
+
+
+class MessageSearchResults(BaseModel):
+    results: List[MessageSearchHit] = Field(..., description="Найденные сообщения, самые релевантные первыми")
+    has_more: bool = Field(..., description="Есть следующая страница")
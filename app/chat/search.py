@@ -0,0 +1,72 @@
+import re
+from typing import List
+from sqlalchemy import text
+
+# Границы найденных слов во фрагменте: клиент экранирует текст и только потом подсвечивает
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+
+POSTGRES_DDL = [
+    """
+    ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_messages_content_tsv ON messages USING gin (content_tsv)",
+]
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+
+def ensure_message_search(connection):
+    """Создать колонку и GIN-индекс (Postgres) или FTS5-таблицу (SQLite) для поиска, если их еще нет.
+
+    В проде схему создает миграция 004, здесь — то же для баз, созданных через create_all.
+    """
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+    elif dialect == "sqlite":
+        created = not connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")
+        ).first()
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if created:
+            # Индексируем сообщения, которые были до появления FTS-таблицы
+            connection.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+
+def search_terms(query: str) -> List[str]:
+    """Слова поискового запроса: все, что не буквы и не цифры, считается разделителем"""
+    return re.findall(r"\w+", query)
+
+
+def fts5_query(query: str) -> str:
+    """Запрос FTS5 из пользовательского ввода: каждое слово в кавычках, все слова обязательны.
+
+    Кавычки не дают пользователю случайно (или намеренно) воспользоваться синтаксисом MATCH.
+    """
+    return " ".join(f'"{term}"' for term in search_terms(query))
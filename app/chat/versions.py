@@ -0,0 +1,57 @@
+from typing import Iterable
+from app.chat.manager import CHAT_EVENTS_CHANNEL
+from app.chat.membership import CHAT_MEMBERSHIP_CHANNEL
+from app.chat.pubsub import BaseBroker, broker
+from app.config import settings
+from app.etags import ChangeVersions
+
+CHAT_LIST_CHANNEL = "chat_list"
+
+
+class ChatListVersions:
+    """Версия списка чатов (GET /chat/chats) каждого пользователя для ETag.
+
+    Сообщение (новое, измененное, удаленное) меняет список всем участникам чата и автору,
+    отметка о прочтении — только читателю.
+    Изменения состава чатов приходят без списка пользователей, поэтому сбрасывают версии всех.
+    Все события идут через broker, так что версии одинаково двигаются на всех воркерах.
+    """
+
+    def __init__(self, broker: BaseBroker, max_keys: int):
+        self.broker = broker
+        self.versions = ChangeVersions(max_keys)
+        broker.subscribe(CHAT_EVENTS_CHANNEL, self._on_chat_event)
+        broker.subscribe(CHAT_MEMBERSHIP_CHANNEL, self._on_membership)
+        broker.subscribe(CHAT_LIST_CHANNEL, self._on_changed)
+
+    def etag(self, user_id: int) -> str:
+        return self.versions.etag(user_id, user_id)
+
+    async def changed(self, user_ids: Iterable[int]):
+        """Список чатов этих пользователей изменился не из-за сообщения (например, прочитаны сообщения)"""
+        user_ids = list(user_ids)
+        # Свой воркер сдвигаем сразу: следующий запрос клиента может прийти раньше события broker
+        self._bump(user_ids)
+        await self.broker.publish(CHAT_LIST_CHANNEL, {"user_ids": user_ids})
+
+    def _bump(self, user_ids: Iterable[int]):
+        for user_id in user_ids:
+            self.versions.bump(user_id)
+
+    async def _on_chat_event(self, event: dict):
+        message = event["message"]
+        if message.get('type') in ('message', 'message_edited', 'message_deleted'):
+            self._bump(event["user_ids"])
+            if message.get('sender_id') is not None:
+                self.versions.bump(message['sender_id'])
+        elif message.get('type') == 'chat_changed':
+            self.versions.bump_all()
+
+    async def _on_membership(self, event: dict):
+        self.versions.bump_all()
+
+    async def _on_changed(self, event: dict):
+        self._bump(event["user_ids"])
+
+
+chat_list_versions = ChatListVersions(broker, max_keys=settings.ETAG_VERSIONS_MAX_KEYS)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from sqlalchemy.exc import SQLAlchemyError
+from app.chat.dao import MessagesDAO
+from app.chat.models import Message
+from app.config import settings
+from app.database import async_session_maker
+from app.metrics import SIZE_BUCKETS, Histogram, operation
+
+batch_size = Histogram("message_batch_size", "Messages per group-commit batch", buckets=SIZE_BUCKETS)
+
+PendingMessage = Tuple[dict, asyncio.Future]
+
+
+class MessageBatchWriter:
+    """Group commit: сообщения от параллельных отправителей пишутся одним INSERT ... RETURNING.
+
+    Пачка сбрасывается, когда набралось max_batch_size сообщений или прошло window секунд
+    с момента прихода первого сообщения пачки.
+    """
+
+    def __init__(self, session_maker, max_batch_size: int, window: float):
+        self.session_maker = session_maker
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue: "asyncio.Queue[Optional[PendingMessage]]" = asyncio.Queue()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить writer, дописав все, что уже стоит в очереди"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        self._full.set()
+        await self._task
+        self._task = None
+
+    async def add(self, **values) -> Message:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((values, future))
+        if self._queue.qsize() >= self.max_batch_size:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            if self._queue.qsize() + 1 < self.max_batch_size:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            batch, stopping = self._drain([first])
+            await self._flush(batch)
+
+        # Дописываем то, что успели положить в очередь вместе с сигналом остановки
+        while not self._queue.empty():
+            batch, _ = self._drain([])
+            if batch:
+                await self._flush(batch)
+
+    def _drain(self, batch: List[PendingMessage]) -> Tuple[List[PendingMessage], bool]:
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch: List[PendingMessage]):
+        try:
+            messages = await self._insert([values for values, _ in batch])
+        except SQLAlchemyError as e:
+            if len(batch) == 1:
+                self._reject(batch[0][1], e)
+                return
+            # Одна плохая строка не должна ронять всю пачку — повторяем по одной
+            logging.warning(f"Batched insert of {len(batch)} messages failed, retrying one by one: {e}")
+            for item in batch:
+                await self._flush([item])
+            return
+        except Exception as e:
+            for _, future in batch:
+                self._reject(future, e)
+            return
+
+        for (_, future), message in zip(batch, messages):
+            if not future.done():
+                future.set_result(message)
+
+    async def _insert(self, values: List[dict]) -> List[Message]:
+        batch_size.observe(len(values))
+        with operation("MessageBatchWriter.insert"):
+            return await self._insert_batch(values)
+
+    async def _insert_batch(self, values: List[dict]) -> List[Message]:
+        async with self.session_maker() as session:
+            async with session.begin():
+                return await MessagesDAO.insert_messages(values, session=session)
+
+    @staticmethod
+    def _reject(future: asyncio.Future, error: Exception):
+        if not future.done():
+            future.set_exception(error)
+
+
+message_writer = MessageBatchWriter(
+    session_maker=async_session_maker,
+    max_batch_size=settings.MESSAGE_BATCH_MAX_SIZE,
+    window=settings.MESSAGE_BATCH_WINDOW_MS / 1000,
+)
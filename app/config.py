@@ -1,10 +1,93 @@
 import os
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
+    # Pub/sub для доставки сообщений между воркерами: "memory" (один процесс) или "postgres" (LISTEN/NOTIFY)
+    PUBSUB_BACKEND: str = "memory"
+    PUBSUB_MAX_RECIPIENTS_PER_EVENT: int = 500
+    # Сколько ID участников (суммарно по всем чатам) держит в памяти индекс членства
+    CHAT_MEMBERSHIP_CACHE_MAX_MEMBERS: int = 1_000_000
+    # Размер страницы справочника пользователей
+    USERS_PAGE_SIZE: int = 50
+    USERS_PAGE_SIZE_MAX: int = 200
+    # Размер страницы истории сообщений
+    MESSAGES_PAGE_SIZE: int = 50
+    MESSAGES_PAGE_SIZE_MAX: int = 200
+    # Server-Sent Events: интервал heartbeat, пауза переподключения клиента, сколько пропущенных сообщений досылать
+    SSE_HEARTBEAT_SECONDS: int = 15
+    SSE_RETRY_MS: int = 3000
+    SSE_REPLAY_LIMIT: int = 500
+    # Delta-sync: максимальное время ожидания long-poll запроса
+    SYNC_WAIT_MAX_SECONDS: int = 30
+    # Кэш последних сообщений активных чатов: сколько сообщений на чат и общий бюджет памяти
+    HISTORY_CACHE_MESSAGES_PER_CHAT: int = 50
+    HISTORY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # Поиск: размер страницы и сколько самых свежих совпадений ранжировать
+    SEARCH_PAGE_SIZE: int = 20
+    SEARCH_PAGE_SIZE_MAX: int = 50
+    SEARCH_MAX_CANDIDATES: int = 1000
+    # Список чатов: непрочитанные считаются не дальше CAP (клиент показывает "99+"), превью — первые символы
+    UNREAD_COUNT_CAP: int = 99
+    LAST_MESSAGE_PREVIEW_LENGTH: int = 100
+    # ETag опрашиваемых списков: сколько версий списка чатов (по пользователю) держать в памяти воркера
+    ETAG_VERSIONS_MAX_KEYS: int = 100_000
+    # Помесячные партиции messages (Postgres): сколько полных месяцев держать в БД и на сколько вперед создавать
+    MESSAGES_HOT_MONTHS: int = 6
+    MESSAGES_PARTITIONS_AHEAD: int = 3
+    # Архив старых партиций: каталог сегментов, сообщений в одном gzip-блоке, сколько распакованных блоков кэшировать
+    MESSAGE_ARCHIVE_DIR: str = "archive/messages"
+    MESSAGE_ARCHIVE_BLOCK_MESSAGES: int = 1000
+    MESSAGE_ARCHIVE_CACHE_BLOCKS: int = 64
+    # Group commit: копить сообщения и писать их одним INSERT (пачка до MAX_SIZE или окно WINDOW_MS)
+    MESSAGE_BATCH_WRITER: bool = False
+    MESSAGE_BATCH_MAX_SIZE: int = 100
+    MESSAGE_BATCH_WINDOW_MS: int = 5
+    # Исходящая очередь каждого WebSocket-подключения и политика для медленных клиентов: "drop" или "disconnect"
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SLOW_CONSUMER_POLICY: str = "drop"
+    # Входящие кадры WebSocket: token bucket на пользователя (любые кадры) и на чат (сообщения); rate 0 — без лимита
+    WS_USER_MESSAGES_PER_SECOND: float = Field(5, ge=0)
+    WS_USER_BURST: int = Field(20, ge=1)
+    WS_CHAT_MESSAGES_PER_SECOND: float = Field(30, ge=0)
+    WS_CHAT_BURST: int = Field(60, ge=1)
+    WS_RATE_LIMIT_MAX_KEYS: int = Field(100_000, ge=1)
+    # Сколько отклоненных кадров подряд терпим и сколько прощаем в секунду, прежде чем закрыть подключение;
+    # decay 0 — нарушения не прощаются вовсе
+    WS_THROTTLE_MAX_VIOLATIONS: int = Field(50, ge=1)
+    WS_THROTTLE_VIOLATIONS_DECAY: float = Field(1, ge=0)
+    # Досылка пропущенного при переподключении WebSocket: сколько чатов и событий на чат, сколько досылок параллельно
+    WS_RESUME_MAX_CHATS: int = 100
+    WS_RESUME_MAX_EVENTS: int = 500
+    WS_RESUME_CONCURRENCY: int = 4
+    # Пакетная отправка по WebSocket: операций в одном кадре, длина клиентского ID, сколько дней помнить ID для повторов
+    WS_BATCH_MAX_OPS: int = 100
+    WS_CLIENT_ID_MAX_LENGTH: int = 64
+    CLIENT_MESSAGE_IDS_RETENTION_DAYS: int = 30
+    # Кэш проверенных токенов в get_current_user
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL_SECONDS: int = 60
+    # Стоимость bcrypt и пул потоков для хэширования паролей
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_MAX_WORKERS: int = 4
+    BCRYPT_MAX_CONCURRENCY: int = 8
+    # Пул подключений к Postgres. Воркеров * (DB_POOL_SIZE + DB_MAX_OVERFLOW) должно укладываться в max_connections
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Кэш подготовленных выражений asyncpg на подключение; 0 — для pgbouncer в transaction mode
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # Статика: собирать файлы с хэшем в имени при старте; False — манифест готовит python -m app.assets при сборке образа
+    ASSETS_BUILD_ON_STARTUP: bool = True
+    # /metrics в формате Prometheus: по умолчанию выключен — порт приложения опубликован наружу напрямую.
+    # С METRICS_TOKEN отдается только с заголовком Authorization: Bearer <токен>
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: str = ""
     model_config = SettingsConfigDict(
         env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
     )
@@ -1,42 +1,154 @@
-from sqlalchemy.exc import SQLAlchemyError
+import asyncio
+import functools
+import inspect
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Set
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import update as sqlalchemy_update, delete as sqlalchemy_delete, func
 from app.database import async_session_maker
+from app.metrics import operation
+
+
+@asynccontextmanager
+async def session_scope(session: Optional[AsyncSession] = None, commit: bool = False) -> AsyncIterator[AsyncSession]:
+    """Сессия вызывающего (unit of work запроса) или отдельная сессия на один вызов DAO.
+
+    Отдельная сессия при commit=True коммитится на выходе. Переданную сессию коммитит ее владелец.
+    """
+    if session is not None:
+        yield session
+        return
+    async with async_session_maker() as new_session:
+        if not commit:
+            yield new_session
+            return
+        async with new_session.begin():
+            yield new_session
+
+
+# Задачи после коммита: цикл событий держит на задачу только слабую ссылку
+_after_commit_tasks: Set[asyncio.Task] = set()
+
+
+def _after_commit_done(task: asyncio.Task):
+    _after_commit_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"After-commit callback failed: {task.exception()!r}")
+
+
+async def after_commit(session: Optional[AsyncSession], callback: Callable[[], Awaitable[None]]):
+    """Выполнить callback после коммита: сразу для собственной сессии DAO, для чужой — когда ее закоммитят.
+
+    Если транзакцию чужой сессии откатят, callback отменяется: следующий коммит той же сессии
+    не должен рассылать то, что не записалось.
+    """
+    if session is None:
+        await callback()
+        return
+    pending = [callback]
+
+    def on_commit(sync_session):
+        if pending:
+            task = asyncio.get_running_loop().create_task(pending.pop()())
+            _after_commit_tasks.add(task)
+            task.add_done_callback(_after_commit_done)
+
+    def on_rollback(sync_session):
+        pending.clear()
+
+    event.listen(session.sync_session, "after_commit", on_commit, once=True)
+    event.listen(session.sync_session, "after_rollback", on_rollback, once=True)
+
+
+def _instrument(dao_class):
+    """Помечаем запросы к БД внутри публичных методов DAO именем метода — для db_query_seconds"""
+    for name, attr in list(vars(dao_class).items()):
+        if name.startswith('_') or not isinstance(attr, classmethod) or not inspect.iscoroutinefunction(attr.__func__):
+            continue
+
+        def wrap(method, name=name):
+            @functools.wraps(method)
+            async def wrapper(cls, *args, **kwargs):
+                with operation(f"{cls.__name__}.{name}"):
+                    return await method(cls, *args, **kwargs)
+            return wrapper
+
+        setattr(dao_class, name, classmethod(wrap(attr.__func__)))
 
 
 class BaseDAO:
     model = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _instrument(cls)
+
     @classmethod
-    async def find_one_or_none_by_id(cls, data_id: int):
-        async with async_session_maker() as session:
+    async def find_one_or_none_by_id(cls, data_id: int, session: AsyncSession = None):
+        async with session_scope(session) as session:
             query = select(cls.model).filter_by(id=data_id)
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
     @classmethod
-    async def find_one_or_none(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def find_many_by_ids(cls, ids: Iterable[int], session: AsyncSession = None):
+        ids = set(ids)
+        if not ids:
+            return []
+        async with session_scope(session) as session:
+            query = select(cls.model).where(cls.model.id.in_(ids))
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    @classmethod
+    async def find_one_or_none(cls, session: AsyncSession = None, **filter_by):
+        async with session_scope(session) as session:
             query = select(cls.model).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
     @classmethod
-    async def find_all(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def find_all(cls, session: AsyncSession = None, **filter_by):
+        async with session_scope(session) as session:
             query = select(cls.model).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalars().all()
 
     @classmethod
-    async def add(cls, **values):
-        async with async_session_maker() as session:
-            async with session.begin():
-                new_instance = cls.model(**values)
-                session.add(new_instance)
-                try:
-                    await session.commit()
-                except SQLAlchemyError as e:
-                    await session.rollback()
-                    raise e
-                return new_instance
\ No newline at end of file
+    async def add(cls, session: AsyncSession = None, **values):
+        own_session = session is None
+        async with session_scope(session, commit=True) as session:
+            new_instance = cls.model(**values)
+            session.add(new_instance)
+            if not own_session:
+                await session.flush()
+            return new_instance
+
+    @classmethod
+    async def add_many(cls, values_list: List[dict], session: AsyncSession = None) -> list:
+        """Вставить несколько строк; SQLAlchemy отправит их одним многострочным INSERT"""
+        if not values_list:
+            return []
+        async with session_scope(session, commit=True) as session:
+            new_instances = [cls.model(**values) for values in values_list]
+            session.add_all(new_instances)
+            await session.flush()
+            return new_instances
+
+    @classmethod
+    async def update(cls, filter_by: dict, session: AsyncSession = None, **values) -> int:
+        async with session_scope(session, commit=True) as session:
+            query = (
+                sqlalchemy_update(cls.model)
+                .filter_by(**filter_by)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            result = await session.execute(query)
+            return result.rowcount
+
+
+_instrument(BaseDAO)
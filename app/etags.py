@@ -0,0 +1,77 @@
+import os
+import zlib
+from collections import OrderedDict
+from typing import Hashable
+from fastapi import Request, Response
+from app.metrics import Counter
+
+not_modified_responses = Counter("http_not_modified_total", "Conditional GETs answered with 304", ["endpoint"])
+
+# Ответы опрашиваемых списков браузер хранит, но каждый раз перепроверяет по ETag
+CACHE_CONTROL = "private, no-cache"
+
+
+class ChangeVersions:
+    """Счетчики изменений по ключу в памяти воркера — из них строятся ETag без чтения БД.
+
+    Каждое изменение присваивает ключу следующее значение общих часов, поэтому версия ключа никогда
+    не повторяется. Ключи хранятся в LRU: вытесненный ключ поднимает нижнюю границу, и отсутствующие
+    ключи получают версию не меньше любой вытесненной. Версии имеют смысл только в этом процессе —
+    в ETag они идут вместе с epoch.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.epoch = os.urandom(4).hex()
+        self._clock = 0
+        self._floor = 0
+        self._versions: "OrderedDict[Hashable, int]" = OrderedDict()
+
+    def get(self, key: Hashable = None) -> int:
+        version = self._versions.get(key)
+        if version is None:
+            return self._floor
+        self._versions.move_to_end(key)
+        return version
+
+    def bump(self, key: Hashable = None):
+        self._clock += 1
+        self._versions[key] = self._clock
+        self._versions.move_to_end(key)
+        while len(self._versions) > self.max_keys:
+            _, evicted = self._versions.popitem(last=False)
+            self._floor = max(self._floor, evicted)
+
+    def bump_all(self):
+        """Изменились все ключи сразу"""
+        self._clock += 1
+        self._floor = self._clock
+        self._versions.clear()
+
+    def etag(self, key: Hashable = None, *variant) -> str:
+        """Слабый ETag версии ключа; variant — параметры запроса, от которых зависит ответ"""
+        tag = f"{self.epoch}-{self.get(key):x}"
+        if variant:
+            tag += f"-{zlib.crc32(repr(variant).encode()):08x}"
+        return f'W/"{tag}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match запроса совпадает с etag (слабое сравнение)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str, endpoint: str) -> Response:
+    not_modified_responses.inc(1, endpoint)
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
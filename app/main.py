@@ -1,14 +1,22 @@
+import hmac
 from fastapi import FastAPI, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from fastapi.exceptions import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from app.assets import static_assets
 from app.exceptions import TokenExpiredException, TokenNoFoundException
 from app.users.router import router as users_router
 from app.chat.router import router as chat_router
+from app.chat.partitions import ensure_message_partitions
+from app.chat.search import ensure_message_search
+from app.chat.pubsub import broker
+from app.chat.writer import message_writer
+from app.users.directory import ensure_user_directory_indexes
+from app.config import settings
+from app.metrics import MetricsMiddleware, registry
 
 app = FastAPI()
-app.mount('/static', StaticFiles(directory='app/static'), name='static')
+app.mount('/static', static_assets, name='static')
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +25,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(users_router)
 app.include_router(chat_router)
@@ -31,14 +40,44 @@ async def startup_event():
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_message_search)
+        await conn.run_sync(ensure_message_partitions)
+        await conn.run_sync(ensure_user_directory_indexes)
     print("✅ Все таблицы созданы")
 
+    if settings.ASSETS_BUILD_ON_STARTUP:
+        static_assets.build()
+    else:
+        static_assets.load()
+
+    await broker.start()
+    if settings.MESSAGE_BATCH_WRITER:
+        await message_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await message_writer.stop()
+    await broker.stop()
+
 
 @app.get("/")
 async def redirect_to_auth():
     return RedirectResponse(url="/auth")
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Метрики воркера в текстовом формате Prometheus"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("authorization", "").encode(), expected.encode()):
+            raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.exception_handler(TokenExpiredException)
 async def token_expired_exception_handler(request: Request, exc: HTTPException):
     return RedirectResponse(url="/auth")
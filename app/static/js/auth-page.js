@@ -0,0 +1,20 @@
+function showForm(formType) {
+    // Убираем активный класс со всех табов и форм
+    document.querySelectorAll('.tab').forEach(tab => tab.classList.remove('active'));
+    document.querySelectorAll('.form').forEach(form => form.classList.remove('active'));
+
+    // Активируем выбранный таб и форму
+    if (formType === 'login') {
+        document.querySelector('.tab:nth-child(1)').classList.add('active');
+        document.getElementById('loginForm').classList.add('active');
+    } else {
+        document.querySelector('.tab:nth-child(2)').classList.add('active');
+        document.getElementById('registerForm').classList.add('active');
+    }
+
+    // Очищаем сообщения при переключении форм
+    const messageDiv = document.querySelector('.message');
+    if (messageDiv) {
+        messageDiv.remove();
+    }
+}
@@ -0,0 +1,507 @@
+class ChatApp {
+    constructor() {
+        this.currentUser = chatConfig.currentUser;
+        this.currentChat = null;
+        // Последний seq открытого чата: по нему после обрыва досылается только пропущенное
+        this.chatSeq = null;
+        this.resumePending = false;
+        this.ws = null;
+        this.wsFailures = 0;
+        this.eventSource = null;
+        this.selectedParticipants = new Set();
+        this.userSearch = {timer: null, controller: null};
+        this.unreadCountCap = chatConfig.unreadCountCap;
+
+        this.initializeWebSocket();
+        this.setupEventListeners();
+    }
+
+    initializeWebSocket() {
+        const resume = this.currentChat && this.chatSeq !== null ? `?resume=${this.currentChat}:${this.chatSeq}` : '';
+        this.ws = new WebSocket(`ws://${window.location.host}/chat/ws/${this.currentUser.id}${resume}`);
+        let opened = false;
+
+        this.ws.onopen = () => {
+            opened = true;
+            this.wsFailures = 0;
+            console.log('WebSocket connected');
+        };
+
+        this.ws.onmessage = (event) => {
+            try {
+                const data = JSON.parse(event.data);
+                this.handleWebSocketMessage(data);
+            } catch (error) {
+                console.error('Error parsing message:', error);
+            }
+        };
+
+        this.ws.onclose = () => {
+            console.log('WebSocket disconnected');
+            // WebSocket режется прокси — переходим на Server-Sent Events, отправка пойдет через HTTP
+            if (!opened && ++this.wsFailures >= 2) {
+                this.initializeEventStream();
+                return;
+            }
+            setTimeout(() => this.initializeWebSocket(), 3000);
+        };
+
+        this.ws.onerror = (error) => {
+            console.error('WebSocket error:', error);
+        };
+    }
+
+    initializeEventStream() {
+        // Переподключается EventSource сам и присылает Last-Event-ID — пропущенное сервер дошлет
+        this.eventSource = new EventSource('/chat/events');
+
+        this.eventSource.addEventListener('message', (event) => {
+            this.handleWebSocketMessage(JSON.parse(event.data));
+        });
+
+        this.eventSource.addEventListener('resync', () => {
+            if (this.currentChat) {
+                this.loadMessageHistory(this.currentChat);
+            }
+        });
+    }
+
+    setupEventListeners() {
+        // Отправка сообщения по Enter
+        document.getElementById('messageInput').addEventListener('keypress', (e) => {
+            if (e.key === 'Enter') {
+                this.sendMessage();
+            }
+        });
+
+        // Подгрузка более старых сообщений при прокрутке вверх
+        document.getElementById('messagesContainer').addEventListener('scroll', (e) => {
+            if (e.target.scrollTop < 50) {
+                this.loadOlderMessages();
+            }
+        });
+    }
+
+    async selectChat(chatId, chatTitle) {
+        this.currentChat = chatId;
+        this.chatSeq = null;
+
+        // Обновляем UI
+        document.querySelectorAll('.chat-item').forEach(item => {
+            item.classList.remove('active');
+        });
+        event.currentTarget.classList.add('active');
+
+        document.getElementById('currentChatTitle').textContent = chatTitle;
+        document.getElementById('messageInputContainer').style.display = 'block';
+        document.querySelector('.no-chat-selected').style.display = 'none';
+
+        // Загружаем историю сообщений
+        await this.loadMessageHistory(chatId);
+    }
+
+    async loadMessageHistory(chatId) {
+        try {
+            const response = await fetch(`/chat/messages/${chatId}`);
+            const messages = await response.json();
+
+            const container = document.getElementById('messagesContainer');
+            container.innerHTML = '';
+            this.chatSeq = messages.reduce((seq, message) => Math.max(seq, message.seq || 0), 0);
+            this.resumePending = false;
+            this.oldestMessageId = messages.length ? messages[0].id : null;
+            this.hasOlderMessages = messages.length > 0;
+
+            if (messages.length === 0) {
+                const noMessages = document.createElement('div');
+                noMessages.className = 'no-chat-selected';
+                noMessages.innerHTML = '<h3>💬 Начните общение!</h3><p>Пока нет сообщений в этом чате</p>';
+                container.appendChild(noMessages);
+                return;
+            }
+
+            messages.forEach(message => {
+                this.displayMessage(message);
+            });
+
+            this.scrollToBottom();
+            this.markRead(chatId);
+        } catch (error) {
+            console.error('Error loading message history:', error);
+        }
+    }
+
+    async loadOlderMessages() {
+        if (!this.currentChat || !this.hasOlderMessages || this.loadingOlder) {
+            return;
+        }
+        this.loadingOlder = true;
+        const chatId = this.currentChat;
+        try {
+            const response = await fetch(`/chat/messages/${chatId}?before=${this.oldestMessageId}`);
+            const messages = await response.json();
+            if (chatId !== this.currentChat) {
+                return;
+            }
+            if (messages.length === 0) {
+                this.hasOlderMessages = false;
+                return;
+            }
+            this.oldestMessageId = messages[0].id;
+
+            // Сохраняем позицию прокрутки, чтобы лента не прыгала
+            const container = document.getElementById('messagesContainer');
+            const previousHeight = container.scrollHeight;
+            messages.slice().reverse().forEach(message => {
+                this.displayMessage(message, true);
+            });
+            container.scrollTop = container.scrollHeight - previousHeight;
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        } finally {
+            this.loadingOlder = false;
+        }
+    }
+
+    displayMessage(message, prepend = false) {
+        const container = document.getElementById('messagesContainer');
+        const noMessages = container.querySelector('.no-chat-selected');
+        if (noMessages) {
+            noMessages.remove();
+        }
+
+        // Сообщение могло прийти и в ответе на отправку, и в досылке
+        if (container.querySelector(`.message[data-message-id="${message.id}"]`)) {
+            return;
+        }
+
+        const messageElement = document.createElement('div');
+        messageElement.className = `message ${message.sender_id === this.currentUser.id ? 'own' : 'other'}`;
+        messageElement.dataset.messageId = message.id;
+
+        const time = new Date(message.created_at).toLocaleTimeString('ru-RU', {
+            hour: '2-digit',
+            minute: '2-digit'
+        });
+
+        messageElement.innerHTML = `
+            ${message.sender_id !== this.currentUser.id ?
+                `<div class="message-sender">${message.sender_name}</div>` : ''}
+            <div class="message-content">${this.escapeHtml(message.content)}</div>
+            <div class="message-time">${time}</div>
+        `;
+
+        if (prepend) {
+            container.insertBefore(messageElement, container.firstChild);
+            return;
+        }
+        container.appendChild(messageElement);
+        this.scrollToBottom();
+    }
+
+    sendMessage() {
+        const input = document.getElementById('messageInput');
+        const content = input.value.trim();
+
+        if (!content || !this.currentChat) {
+            return;
+        }
+
+        if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+            const message = {
+                type: 'message',
+                chat_id: this.currentChat,
+                content: content
+            };
+            this.ws.send(JSON.stringify(message));
+            this.lastSentContent = content;
+        } else {
+            // Fallback: отправка через HTTP
+            fetch('/chat/messages', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    chat_id: this.currentChat,
+                    content: content
+                })
+            }).then(response => response.json())
+              .then(message => {
+                  this.displayMessage(message);
+              });
+        }
+
+        input.value = '';
+    }
+
+    handleWebSocketMessage(data) {
+        if (data.type === 'throttled') {
+            // Сервер отклонил кадр по лимиту — возвращаем текст в поле ввода, чтобы отправить позже
+            const input = document.getElementById('messageInput');
+            if (!input.value && this.lastSentContent) {
+                input.value = this.lastSentContent;
+            }
+            console.warn(`Rate limited (${data.scope}), retry in ${data.retry_after}s`);
+            return;
+        }
+        if (data.type === 'replay') {
+            if (data.chat_id === this.currentChat) {
+                data.events.forEach(event => this.applyChatEvent(event));
+                this.chatSeq = Math.max(this.chatSeq || 0, data.seq);
+                this.resumePending = false;
+            }
+            return;
+        }
+        if (data.type === 'resync') {
+            // Пропущено слишком много — перечитываем историю целиком
+            if (data.chat_id === this.currentChat) {
+                this.loadMessageHistory(this.currentChat);
+            }
+            return;
+        }
+        if (data.chat_id === this.currentChat && this.chatSeq !== null && data.seq) {
+            if (data.seq <= this.chatSeq) {
+                return;
+            }
+            if (data.seq > this.chatSeq + 1) {
+                // Между последним виденным и этим событием что-то потерялось — досылка придет по порядку
+                this.requestResume();
+                return;
+            }
+            this.chatSeq = data.seq;
+        }
+        this.applyChatEvent(data);
+    }
+
+    applyChatEvent(data) {
+        if (data.type === 'message_edited' || data.type === 'message_deleted') {
+            const element = data.chat_id === this.currentChat &&
+                document.querySelector(`#messagesContainer .message[data-message-id="${data.id}"]`);
+            if (element && data.type === 'message_edited') {
+                element.querySelector('.message-content').textContent = data.content;
+            } else if (element) {
+                element.remove();
+            }
+            return;
+        }
+        if (data.type !== 'message') {
+            return;
+        }
+        this.updateChatPreview(data);
+        if (data.chat_id === this.currentChat) {
+            this.displayMessage(data);
+            if (data.sender_id !== this.currentUser.id) {
+                this.markRead(data.chat_id, data.id);
+            }
+        } else if (data.sender_id !== this.currentUser.id) {
+            this.setUnread(data.chat_id, this.getUnread(data.chat_id) + 1);
+        }
+    }
+
+    requestResume() {
+        if (this.resumePending) {
+            return;
+        }
+        if (!this.ws || this.ws.readyState !== WebSocket.OPEN) {
+            this.loadMessageHistory(this.currentChat);
+            return;
+        }
+        this.resumePending = true;
+        this.ws.send(JSON.stringify({type: 'resume', chats: {[this.currentChat]: this.chatSeq}}));
+    }
+
+    chatItem(chatId) {
+        return document.querySelector(`.chat-item[data-chat-id="${chatId}"]`);
+    }
+
+    getUnread(chatId) {
+        const item = this.chatItem(chatId);
+        return item ? parseInt(item.dataset.unread || '0', 10) : 0;
+    }
+
+    setUnread(chatId, count) {
+        const item = this.chatItem(chatId);
+        if (!item) {
+            return;
+        }
+        item.dataset.unread = count;
+        const badge = item.querySelector('.unread-count');
+        badge.textContent = count > this.unreadCountCap ? `${this.unreadCountCap}+` : count;
+        badge.style.display = count ? '' : 'none';
+    }
+
+    updateChatPreview(message) {
+        const item = this.chatItem(message.chat_id);
+        if (!item) {
+            return;
+        }
+        item.querySelector('.chat-preview').textContent = `${message.sender_name}: ${message.content}`;
+        // Чат с новым сообщением поднимается наверх списка
+        item.parentNode.insertBefore(item, item.parentNode.firstChild);
+    }
+
+    markRead(chatId, messageId = null) {
+        this.setUnread(chatId, 0);
+        fetch(`/chat/chats/${chatId}/read`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(messageId ? {message_id: messageId} : {})
+        }).catch(error => console.error('Error marking chat as read:', error));
+    }
+
+    scrollToBottom() {
+        const container = document.getElementById('messagesContainer');
+        container.scrollTop = container.scrollHeight;
+    }
+
+    escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+}
+
+// Функции для управления участниками
+// Поиск идет на сервере по префиксу имени (или email); запрос уходит, когда пользователь перестал печатать
+const USER_SEARCH_DELAY_MS = 250;
+const USER_SUGGESTIONS_LIMIT = 20;
+
+function searchUsers(query) {
+    const search = window.chatApp.userSearch;
+    clearTimeout(search.timer);
+    if (search.controller) {
+        search.controller.abort();
+    }
+
+    if (!query.trim()) {
+        renderUserSuggestions([]);
+        return;
+    }
+    search.timer = setTimeout(() => fetchUserSuggestions(query.trim()), USER_SEARCH_DELAY_MS);
+}
+
+async function fetchUserSuggestions(query) {
+    const search = window.chatApp.userSearch;
+    search.controller = new AbortController();
+    // Себя и уже выбранных отсекаем на клиенте — берем с запасом
+    const limit = USER_SUGGESTIONS_LIMIT + window.chatApp.selectedParticipants.size + 1;
+    const params = new URLSearchParams({q: query, limit: limit});
+    try {
+        const response = await fetch(`/auth/users?${params}`, {signal: search.controller.signal});
+        const users = await response.json();
+        renderUserSuggestions(users.filter(user =>
+            user.id !== window.chatApp.currentUser.id &&
+            !window.chatApp.selectedParticipants.has(user.id)
+        ).slice(0, USER_SUGGESTIONS_LIMIT));
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Error searching users:', error);
+        }
+    }
+}
+
+function renderUserSuggestions(users) {
+    const suggestions = document.getElementById('userSuggestions');
+    suggestions.innerHTML = '';
+
+    if (users.length > 0) {
+        users.forEach(user => {
+            const suggestion = document.createElement('div');
+            suggestion.className = 'user-suggestion';
+            suggestion.textContent = user.name;
+            suggestion.onclick = () => addParticipant(user.id, user.name);
+            suggestions.appendChild(suggestion);
+        });
+        suggestions.style.display = 'block';
+    } else {
+        suggestions.style.display = 'none';
+    }
+}
+
+function addParticipant(userId, userName) {
+    if (window.chatApp.selectedParticipants.has(userId)) {
+        return;
+    }
+
+    window.chatApp.selectedParticipants.add(userId);
+
+    const participantsInput = document.getElementById('participantsInput');
+    const tag = document.createElement('div');
+    tag.className = 'participant-tag';
+    tag.innerHTML = `
+        ${userName}
+        <span class="remove-participant" onclick="removeParticipant(${userId}, this)">×</span>
+    `;
+    participantsInput.insertBefore(tag, document.getElementById('participantSearch'));
+
+    document.getElementById('participantSearch').value = '';
+    document.getElementById('userSuggestions').style.display = 'none';
+}
+
+function removeParticipant(userId, element) {
+    window.chatApp.selectedParticipants.delete(userId);
+    element.parentElement.remove();
+}
+
+// Функции модального окна
+function showCreateChatModal() {
+    document.getElementById('createChatModal').style.display = 'flex';
+    window.chatApp.selectedParticipants.clear();
+    document.getElementById('participantsInput').innerHTML =
+        '<input type="text" class="participant-input" id="participantSearch" placeholder="Введите имя пользователя..." oninput="searchUsers(this.value)">';
+    document.getElementById('chatName').value = '';
+}
+
+function hideCreateChatModal() {
+    document.getElementById('createChatModal').style.display = 'none';
+}
+
+async function createChat() {
+    const chatName = document.getElementById('chatName').value;
+    const participantIds = Array.from(window.chatApp.selectedParticipants).join(',');
+
+    if (window.chatApp.selectedParticipants.size === 0) {
+        alert('Добавьте хотя бы одного участника');
+        return;
+    }
+
+    try {
+        const formData = new FormData();
+        formData.append('chat_name', chatName);
+        formData.append('participant_ids', participantIds);
+
+        const response = await fetch('/chat/create', {
+            method: 'POST',
+            body: formData
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            alert('Чат успешно создан!');
+            hideCreateChatModal();
+            location.reload(); // Перезагружаем страницу для обновления списка чатов
+        } else {
+            alert('Ошибка: ' + result.error);
+        }
+    } catch (error) {
+        alert('Ошибка при создании чата: ' + error.message);
+    }
+}
+
+// Глобальные функции для HTML
+function selectChat(chatId, chatTitle) {
+    window.chatApp.selectChat(chatId, chatTitle);
+}
+
+function sendMessage() {
+    window.chatApp.sendMessage();
+}
+
+// Инициализация приложения
+document.addEventListener('DOMContentLoaded', () => {
+    window.chatApp = new ChatApp();
+});
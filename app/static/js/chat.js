@@ -1,6 +1,10 @@
 let selectedUserId = null;
 let socket = null;
-let messagePollingInterval = null;
+let lastSeq = 0;
+// ID уже показанных сообщений: одно и то же сообщение может прийти и по WebSocket, и через sync
+let renderedMessageIds = new Set();
+// Поколение синхронизации: при смене собеседника старый цикл long-poll завершается сам
+let syncGeneration = 0;
 
 // Функция для выхода из аккаунта
 async function logout() {
@@ -51,6 +55,9 @@ async function loadMessages(userId) {
         messagesContainer.innerHTML = messages.map(message =>
             createMessageElement(message.content, message.sender_id)
         ).join('');
+        renderedMessageIds = new Set(messages.map(message => message.id));
+        // Курсор синхронизации — seq последнего сообщения: в отличие от ID, seq выдается в порядке коммита
+        lastSeq = messages.length ? (messages[messages.length - 1].seq || 0) : 0;
     } catch (error) {
         console.error('Ошибка загрузки сообщений:', error);
     }
@@ -68,7 +75,7 @@ function connectWebSocket() {
     socket.onmessage = (event) => {
         const incomingMessage = JSON.parse(event.data);
         if (incomingMessage.recipient_id === selectedUserId || incomingMessage.sender_id === selectedUserId) {
-            addMessage(incomingMessage.content, incomingMessage.sender_id);
+            addMessage(incomingMessage.content, incomingMessage.sender_id, incomingMessage.id);
         }
     };
 
@@ -84,13 +91,14 @@ async function sendMessage() {
         const payload = {recipient_id: selectedUserId, content: message};
 
         try {
-            await fetch('/chat/messages', {
+            const response = await fetch('/chat/messages', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify(payload)
             });
+            const sent = await response.json();
 
-            addMessage(message, currentUserId);
+            addMessage(message, currentUserId, sent.id);
             messageInput.value = '';
         } catch (error) {
             console.error('Ошибка при отправке сообщения:', error);
@@ -99,7 +107,13 @@ async function sendMessage() {
 }
 
 // Добавление нового сообщения в чат
-function addMessage(text, sender_id) {
+function addMessage(text, sender_id, id) {
+    if (id !== undefined) {
+        if (renderedMessageIds.has(id)) {
+            return;
+        }
+        renderedMessageIds.add(id);
+    }
     const messagesContainer = document.getElementById('messages');
     messagesContainer.insertAdjacentHTML('beforeend', createMessageElement(text, sender_id));
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
@@ -111,16 +125,32 @@ function createMessageElement(text, sender_id) {
     return `<div class="message ${messageClass}">${text}</div>`;
 }
 
-// Периодическая проверка новых сообщений
-function startMessagePolling(userId) {
-    clearInterval(messagePollingInterval);
-    messagePollingInterval = setInterval(() => loadMessages(userId), 1000);
+// Получение новых сообщений: сервер держит запрос, пока не появится новое сообщение
+async function startMessagePolling(userId) {
+    const generation = ++syncGeneration;
+    while (generation === syncGeneration) {
+        try {
+            const response = await fetch(`/chat/messages/${userId}/sync?since_seq=${lastSeq}&wait=25`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const sync = await response.json();
+            if (generation !== syncGeneration) {
+                return;
+            }
+            sync.messages.forEach(message => addMessage(message.content, message.sender_id, message.id));
+            lastSeq = sync.next_since_seq;
+        } catch (error) {
+            console.error('Ошибка синхронизации сообщений:', error);
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    }
 }
 
-// Обновление списка пользователей
+// Первая страница справочника пользователей; остальных находят поиском, а не периодической перезагрузкой
 async function fetchUsers() {
     try {
-        const response = await fetch('/auth/users');
+        const response = await fetch('/auth/users?limit=50');
         const users = await response.json();
         const userList = document.getElementById('userList');
 
@@ -156,7 +186,6 @@ function addUserClickListeners() {
 
 // Привязка действий к элементам
 document.addEventListener('DOMContentLoaded', fetchUsers);
-setInterval(fetchUsers, 10000);
 
 document.getElementById('sendButton').onclick = sendMessage;
 
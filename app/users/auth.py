@@ -1,8 +1,13 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from pydantic import EmailStr
 from jose import jwt
 from datetime import datetime, timedelta, timezone
-from app.config import get_auth_data
+from typing import Optional, Tuple
+from app.config import get_auth_data, settings
+from app.metrics import Histogram
 from app.users.dao import UsersDAO
 
 
@@ -15,7 +20,17 @@ def create_access_token(data: dict) -> str:
     return encode_jwt
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt__rounds фиксирует стоимость: хэши с другой стоимостью считаются устаревшими и перехэшируются при входе
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+# bcrypt отпускает GIL, поэтому хватает пула потоков. Семафор ограничивает число хэширований в работе,
+# чтобы поток логинов не выстраивал бесконечную очередь в пуле
+_hash_executor = ThreadPoolExecutor(max_workers=settings.BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+_hash_semaphore: Optional[asyncio.Semaphore] = None
+
+password_hash_seconds = Histogram("password_hash_seconds", "bcrypt time in the hashing pool", ["operation"])
+password_hash_wait_seconds = Histogram("password_hash_wait_seconds",
+                                       "Time from request to the start of bcrypt work (semaphore and pool queue)")
 
 
 def get_password_hash(password: str) -> str:
@@ -26,8 +41,43 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, started, time.perf_counter() - started
+
+
+async def _run_in_hash_pool(operation: str, func, *args):
+    global _hash_semaphore
+    if _hash_semaphore is None:
+        _hash_semaphore = asyncio.Semaphore(settings.BCRYPT_MAX_CONCURRENCY)
+    requested = time.perf_counter()
+    async with _hash_semaphore:
+        result, started, elapsed = await asyncio.get_running_loop().run_in_executor(_hash_executor, _timed, func, *args)
+    # Метрики пишем из потока event loop, а не из потоков пула
+    password_hash_seconds.observe(elapsed, operation)
+    password_hash_wait_seconds.observe(started - requested)
+    return result
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Хэширование пароля вне event loop"""
+    return await _run_in_hash_pool("hash", pwd_context.hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Проверка пароля вне event loop. Возвращает (верен ли пароль, новый хэш, если старый устарел)"""
+    return await _run_in_hash_pool("verify", pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 async def authenticate_user(email: EmailStr, password: str):
     user = await UsersDAO.find_one_or_none(email=email)
-    if not user or verify_password(plain_password=password, hashed_password=user.hashed_password) is False:
+    if not user:
+        return None
+    is_valid, new_hash = await verify_password_async(plain_password=password, hashed_password=user.hashed_password)
+    if not is_valid:
         return None
-    return user
\ No newline at end of file
+    if new_hash:
+        await UsersDAO.update({'id': user.id}, hashed_password=new_hash)
+        user.hashed_password = new_hash
+    return user
@@ -1,6 +1,31 @@
-from app.dao.base import BaseDAO
+from typing import List
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.dao.base import BaseDAO, session_scope
+from app.users.directory import directory_key, prefix_range
 from app.users.models import User
 
 
 class UsersDAO(BaseDAO):
-    model = User
\ No newline at end of file
+    model = User
+
+    @classmethod
+    async def search_directory(cls, prefix: str = None, after_id: int = None, limit: int = 50,
+                               session: AsyncSession = None) -> List[dict]:
+        """Страница справочника: пользователи, у которых имя (или email, если в запросе есть @) начинается с prefix.
+
+        Keyset-пагинация по (lower(поле), id): after_id — последний пользователь предыдущей страницы.
+        Каждая страница — один проход по индексу, без сортировки и без подсчета всех совпадений.
+        """
+        async with session_scope(session) as session:
+            dialect = session.get_bind().dialect.name
+            field = cls.model.email if prefix and '@' in prefix else cls.model.name
+            key = directory_key(field, dialect)
+            query = select(cls.model.id, cls.model.name).order_by(key, cls.model.id).limit(limit)
+            if prefix:
+                query = query.where(prefix_range(key, prefix, dialect))
+            if after_id is not None:
+                cursor = select(key).where(cls.model.id == after_id).scalar_subquery()
+                query = query.where(tuple_(key, cls.model.id) > tuple_(cursor, after_id))
+            result = await session.execute(query)
+            return [{'id': row.id, 'name': row.name} for row in result]
@@ -1,9 +1,13 @@
 from fastapi import Request, HTTPException, status, Depends
 from jose import jwt, JWTError
 from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import get_auth_data
+from app.database import get_session
 from app.exceptions import TokenExpiredException, NoJwtException, NoUserIdException, TokenNoFoundException
 from app.users.dao import UsersDAO
+from app.users.schemas import SCurrentUser
+from app.users.token_cache import token_cache
 
 
 def get_token(request: Request):
@@ -13,7 +17,18 @@ def get_token(request: Request):
     return token
 
 
-async def get_current_user(token: str = Depends(get_token)):
+async def get_current_user(token: str = Depends(get_token),
+                           session: AsyncSession = Depends(get_session)) -> SCurrentUser:
+    return await get_user_by_token(token, session=session)
+
+
+async def get_user_by_token(token: str, session: AsyncSession = None) -> SCurrentUser:
+    """Пользователь по токену доступа; HTTPException, если токен недействителен"""
+    # Уже проверенный токен: без декодирования JWT и без запроса в БД
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
     try:
         auth_data = get_auth_data()
         payload = jwt.decode(token, auth_data['secret_key'], algorithms=auth_data['algorithm'])
@@ -21,15 +36,20 @@ async def get_current_user(token: str = Depends(get_token)):
         raise NoJwtException
 
     expire: str = payload.get('exp')
+    if not expire:
+        raise TokenExpiredException
     expire_time = datetime.fromtimestamp(int(expire), tz=timezone.utc)
-    if (not expire) or (expire_time < datetime.now(timezone.utc)):
+    if expire_time < datetime.now(timezone.utc):
         raise TokenExpiredException
 
     user_id: str = payload.get('sub')
     if not user_id:
         raise NoUserIdException
 
-    user = await UsersDAO.find_one_or_none_by_id(int(user_id))
+    user = await UsersDAO.find_one_or_none_by_id(int(user_id), session=session)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='User not found')
-    return user
\ No newline at end of file
+
+    current_user = SCurrentUser(id=user.id, name=user.name, email=user.email)
+    token_cache.set(token, current_user, token_expires_at=expire_time.timestamp())
+    return current_user
@@ -0,0 +1,68 @@
+from sqlalchemy import String, and_, func, literal, text
+from app.chat.pubsub import broker
+from app.etags import ChangeVersions
+
+USER_DIRECTORY_CHANNEL = "user_directory"
+
+# Справочник пользователей: поиск по префиксу и сортировка по lower(поле), id.
+# В Postgres индекс и запрос используют COLLATE "C" — побайтовый порядок, в котором префикс — это диапазон
+# [prefix, следующий за prefix), и такой диапазон индекс отдает уже отсортированным, в том числе
+# в generic-плане подготовленного выражения. В SQLite порядок BINARY и так побайтовый
+INDEXES = {
+    "postgresql": [
+        'CREATE INDEX IF NOT EXISTS ix_users_lower_name ON users ((lower(name) COLLATE "C"), id)',
+        'CREATE INDEX IF NOT EXISTS ix_users_lower_email ON users ((lower(email) COLLATE "C"), id)',
+    ],
+    "sqlite": [
+        "CREATE INDEX IF NOT EXISTS ix_users_lower_name ON users (lower(name), id)",
+        "CREATE INDEX IF NOT EXISTS ix_users_lower_email ON users (lower(email), id)",
+    ],
+}
+
+
+def ensure_user_directory_indexes(connection):
+    """Индексы справочника для баз, созданных через create_all; в проде их создает миграция 006"""
+    for statement in INDEXES.get(connection.dialect.name, ()):
+        connection.execute(text(statement))
+
+
+def directory_key(column, dialect: str):
+    """Выражение сортировки справочника — ровно то, что стоит в индексе"""
+    key = func.lower(column)
+    return key.collate("C") if dialect == "postgresql" else key
+
+
+# Максимальная кодовая точка: в побайтовом порядке lower(prefix) || PREFIX_SENTINEL больше любой строки,
+# начинающейся с prefix (кроме строк, где сразу за префиксом идет сам U+10FFFF, — это не символ)
+PREFIX_SENTINEL = "\U0010FFFF"
+
+
+def prefix_range(key, prefix: str, dialect: str):
+    """Условие «key начинается с prefix» в виде диапазона индекса.
+
+    Регистр префикса приводит та же lower() базы, что стоит в индексе: Python-овая lower() с ней
+    не совпадает (в SQLite lower() меняет только ASCII), а верхняя граница собирается в SQL,
+    так что суррогатов и других невалидных строк в параметрах не бывает.
+    """
+    lower = func.lower(literal(prefix, String))
+    upper = lower.concat(PREFIX_SENTINEL)
+    if dialect == "postgresql":
+        lower, upper = lower.collate("C"), upper.self_group().collate("C")
+    return and_(key >= lower, key < upper)
+
+
+# Версия справочника для ETag GET /auth/users: пользователи только добавляются, так что хватает одного счетчика
+directory_versions = ChangeVersions(max_keys=1)
+
+
+async def directory_changed():
+    """Сообщить всем воркерам, что справочник изменился (зарегистрирован пользователь)"""
+    directory_versions.bump_all()
+    await broker.publish(USER_DIRECTORY_CHANNEL, {})
+
+
+async def _on_directory_changed(event: dict):
+    directory_versions.bump_all()
+
+
+broker.subscribe(USER_DIRECTORY_CHANNEL, _on_directory_changed)
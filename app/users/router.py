@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Response, Request, Depends, Form, status
+from fastapi import APIRouter, Response, Request, Depends, Form, Query, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.assets import static_assets
+from app.config import settings
+from app.database import get_session
+from app.etags import etag_matches, not_modified, set_etag
 from app.exceptions import UserAlreadyExistsException, IncorrectEmailOrPasswordException, PasswordMismatchException
-from app.users.auth import get_password_hash, authenticate_user, create_access_token
+from app.users.auth import get_password_hash_async, authenticate_user, create_access_token
 from app.users.dao import UsersDAO
-from app.users.schemas import SUserRegister, SUserAuth, SUserRead
+from app.users.schemas import SUserRegister, SUserAuth, SUserRead, SCurrentUser
 from app.users.dependencies import get_current_user
-from app.users.models import User
+from app.users.directory import directory_changed, directory_versions
+from app.users.token_cache import token_cache
 
 router = APIRouter(prefix='/auth', tags=['Auth'])
 templates = Jinja2Templates(directory='app/templates')
+templates.env.globals['asset_url'] = static_assets.url
 
 
 @router.get("/", response_class=HTMLResponse, summary="Страница авторизации")
@@ -50,12 +57,13 @@ async def register_user_form(
             })
 
         # Хэшируем пароль и создаем пользователя
-        hashed_password = get_password_hash(password)
+        hashed_password = await get_password_hash_async(password)
         await UsersDAO.add(
             name=username,
             email=email,
             hashed_password=hashed_password
         )
+        await directory_changed()
 
         return templates.TemplateResponse("auth.html", {
             "request": request,
@@ -110,12 +118,13 @@ async def register_user_api(user_data: SUserRegister) -> dict:
 
     if user_data.password != user_data.password_check:
         raise PasswordMismatchException("Пароли не совпадают")
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     await UsersDAO.add(
         name=user_data.name,
         email=user_data.email,
         hashed_password=hashed_password
     )
+    await directory_changed()
 
     return {'message': 'Вы успешно зарегистрированы!'}
 
@@ -131,13 +140,28 @@ async def auth_user_api(response: Response, user_data: SUserAuth):
 
 
 @router.post("/logout/")
-async def logout_user(response: Response):
+async def logout_user(request: Request, response: Response):
+    token = request.cookies.get('users_access_token')
+    if token:
+        # Только освобождает место в кэше: удаленная cookie не делает сам JWT недействительным
+        token_cache.discard(token)
     response = RedirectResponse(url="/auth/", status_code=status.HTTP_302_FOUND)
     response.delete_cookie(key="users_access_token")
     return response
 
 
 @router.get("/users", response_model=List[SUserRead])
-async def get_users(current_user: User = Depends(get_current_user)):
-    users_all = await UsersDAO.find_all()
-    return [{'id': user.id, 'name': user.name} for user in users_all]
\ No newline at end of file
+async def get_users(request: Request, response: Response,
+                    q: str = Query(None, max_length=100, description="Начало имени или email"),
+                    after_id: int = Query(None, description="Вернуть пользователей после пользователя с этим ID"),
+                    limit: int = Query(settings.USERS_PAGE_SIZE, ge=1, le=settings.USERS_PAGE_SIZE_MAX),
+                    current_user: SCurrentUser = Depends(get_current_user),
+                    session: AsyncSession = Depends(get_session)):
+    """Страница справочника пользователей по алфавиту, с поиском по префиксу имени или email"""
+    # Версия берется до запроса: изменение во время чтения даст новый ETag, а не устаревший ответ под новым
+    etag = directory_versions.etag(None, q, after_id, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag, "users")
+    set_etag(response, etag)
+    return await UsersDAO.search_directory(q.strip() if q else None, after_id=after_id, limit=limit,
+                                           session=session)
\ No newline at end of file
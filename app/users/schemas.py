@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 
 class SUserRegister(BaseModel):
@@ -15,4 +15,13 @@ class SUserAuth(BaseModel):
 
 class SUserRead(BaseModel):
     id: int = Field(..., description="Идентификатор пользователя")
-    name: str = Field(..., min_length=3, max_length=50, description="Имя, от 3 до 50 символов")
\ No newline at end of file
+    name: str = Field(..., min_length=3, max_length=50, description="Имя, от 3 до 50 символов")
+
+
+class SCurrentUser(BaseModel):
+    """Легкий снимок аутентифицированного пользователя (не ORM-объект)"""
+    model_config = ConfigDict(frozen=True)
+
+    id: int = Field(..., description="Идентификатор пользователя")
+    name: str = Field(..., description="Имя пользователя")
+    email: str = Field(..., description="Электронная почта")
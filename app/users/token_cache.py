@@ -0,0 +1,67 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.config import settings
+from app.metrics import FunctionCounter, Gauge
+from app.users.schemas import SCurrentUser
+
+
+class TokenCache:
+    """Кэш проверенных токенов: sha256(token) -> снимок пользователя.
+
+    Ограничен по размеру (LRU) и по времени: запись живет не дольше ttl и не дольше срока действия токена.
+    Снимок содержит только id, имя и email, которые после регистрации не меняются, поэтому кэш
+    не нужно сбрасывать при изменениях пользователя. Токены кэш не отзывает: JWT действителен до exp
+    независимо от того, есть ли он в кэше.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, SCurrentUser]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[SCurrentUser]:
+        key = self.key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, user: SCurrentUser, token_expires_at: float):
+        key = self.key(token)
+        self._entries.pop(key, None)
+        self._entries[key] = (min(time.time() + self.ttl, token_expires_at), user)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, token: str):
+        """Убрать токен из кэша этого воркера (освободить место); это не отзыв токена"""
+        self._entries.pop(self.key(token), None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache(
+    max_size=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS,
+)
+
+Gauge("auth_token_cache_entries", "Verified tokens in the cache", lambda: len(token_cache._entries))
+FunctionCounter("auth_token_cache_hits_total", "Token cache hits", lambda: token_cache.hits)
+FunctionCounter("auth_token_cache_misses_total", "Token cache misses", lambda: token_cache.misses)
@@ -0,0 +1,134 @@
+"""Минимальный ASGI-клиент для бенчмарков: вызывает приложение напрямую, без сети и без httpx"""
+import asyncio
+import json
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlencode
+
+
+async def request(app, method: str, path: str, params: Optional[dict] = None, json_body=None,
+                  form: Optional[dict] = None, cookies: Optional[Dict[str, str]] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    body = b""
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    if json_body is not None:
+        body = json.dumps(json_body).encode()
+        raw_headers.append((b"content-type", b"application/json"))
+    elif form is not None:
+        body = urlencode(form).encode()
+        raw_headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+    if cookies:
+        raw_headers.append((b"cookie", "; ".join(f"{k}={v}" for k, v in cookies.items()).encode()))
+    raw_headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(params or {}).encode(),
+        "root_path": "",
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+    response = {"status": 0, "headers": {}, "body": bytearray()}
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], bytes(response["body"])
+
+
+class WebSocketSession:
+    """WebSocket-подключение к приложению через ASGI, без сети.
+
+    Если задан on_message, входящие кадры передаются в него, а не копятся в очереди —
+    так тысячи подключений не требуют тысяч читающих задач.
+    """
+
+    def __init__(self, app, path: str, cookies: Optional[Dict[str, str]] = None,
+                 on_message: Optional[Callable[[Union[str, bytes]], None]] = None, params: Optional[dict] = None,
+                 subprotocols: Optional[List[str]] = None):
+        self.app = app
+        self.path = path
+        self.params = params
+        self.subprotocols = subprotocols or []
+        # Подпротокол, выбранный сервером при рукопожатии
+        self.subprotocol: Optional[str] = None
+        self.cookies = cookies
+        self.on_message = on_message
+        self._incoming: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._outgoing: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._accepted = False
+
+    async def connect(self):
+        raw_headers = []
+        if self.cookies:
+            raw_headers.append((b"cookie", "; ".join(f"{k}={v}" for k, v in self.cookies.items()).encode()))
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "scheme": "ws",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "query_string": urlencode(self.params or {}).encode(),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+            "subprotocols": self.subprotocols,
+        }
+        self._incoming.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.create_task(self.app(scope, self._incoming.get, self._send))
+        first = asyncio.ensure_future(self._outgoing.get())
+        await asyncio.wait({first, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        if not first.done():
+            first.cancel()
+            self._task.result()
+            raise ConnectionError(f"{self.path}: application finished without accepting the connection")
+        message = first.result()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"{self.path}: connection rejected with {message}")
+        self.subprotocol = message.get("subprotocol")
+        self._accepted = True
+
+    async def _send(self, message: dict):
+        if self._accepted and self.on_message is not None and message["type"] == "websocket.send":
+            self.on_message(message.get("text") or message.get("bytes"))
+        else:
+            self._outgoing.put_nowait(message)
+
+    def send_text(self, text: str):
+        self._incoming.put_nowait({"type": "websocket.receive", "text": text})
+
+    def send_bytes(self, data: bytes):
+        self._incoming.put_nowait({"type": "websocket.receive", "bytes": data})
+
+    async def receive_text(self) -> Union[str, bytes]:
+        message = await self._outgoing.get()
+        if message["type"] == "websocket.close":
+            raise ConnectionError(f"{self.path}: closed with code {message.get('code')}")
+        return message.get("text") or message.get("bytes")
+
+    async def close(self):
+        self._incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            await self._task
@@ -0,0 +1,110 @@
+"""Число SQL-запросов и время создания группового чата в зависимости от числа участников.
+
+Число запросов не должно зависеть от размера группы. С --check скрипт — регрессионная проверка для CI:
+код выхода 1, если число запросов меняется с размером группы или добавлены не все участники.
+
+Запуск:
+    python -m benchmarks.bench_create_chat --sizes 10 100 1000 5000
+    python -m benchmarks.bench_create_chat --sizes 10 1000 --check
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+os.environ.setdefault("DB_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.sqlite")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import event  # noqa: E402
+from app.chat.dao import ChatsDAO  # noqa: E402
+from app.database import Base, async_session_maker, engine  # noqa: E402
+from app.users.dao import UsersDAO  # noqa: E402
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def measure(counter: StatementCounter, call) -> Tuple[int, float]:
+    async with async_session_maker() as session:
+        counter.count = 0
+        started = time.perf_counter()
+        await call(session)
+        await session.commit()
+        return counter.count, time.perf_counter() - started
+
+
+async def main(sizes) -> List[str]:
+    """Замеры по размерам групп; возвращает найденные регрессии"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    users = await UsersDAO.add_many([
+        {"name": f"user{i}", "email": f"user{i}@example.com", "hashed_password": "-"} for i in range(max(sizes) + 2)
+    ])
+    user_ids = [user.id for user in users]
+
+    counter = StatementCounter()
+    event.listen(engine.sync_engine, "before_cursor_execute", counter)
+
+    print(f"{engine.url.get_backend_name()}")
+    create_counts, add_counts, add_one_counts = set(), set(), set()
+    problems = []
+    for size in sizes:
+        participant_ids = user_ids[:size]
+        chat = None
+
+        async def create(session):
+            nonlocal chat
+            chat = await ChatsDAO.create_chat(name=f"group {size}", participant_ids=participant_ids, session=session)
+
+        statements, elapsed = await measure(counter, create)
+        create_counts.add(statements)
+        print(f"  create_chat, {size:>6} participants: {statements} statements, {elapsed * 1000:8.1f} ms")
+
+        # Повторное добавление тех же участников плюс один новый: вставится одна строка
+        extra_ids = participant_ids + [user_ids[size]]
+        statements, elapsed = await measure(
+            counter, lambda session: ChatsDAO.add_participants(chat.id, extra_ids, session=session)
+        )
+        add_counts.add(statements)
+        print(f"  add_participants, {len(extra_ids):>6} ids:     {statements} statements, {elapsed * 1000:8.1f} ms")
+
+        statements, elapsed = await measure(
+            counter, lambda session: ChatsDAO.add_participant_to_chat(chat.id, user_ids[size + 1], session=session)
+        )
+        add_one_counts.add(statements)
+        print(f"  add_participant_to_chat, chat of {size + 1:>6}: {statements} statements, {elapsed * 1000:8.1f} ms")
+        extra_ids.append(user_ids[size + 1])
+
+        participants = await ChatsDAO.get_participant_ids(chat.id)
+        if len(participants) != len(set(extra_ids)):
+            problems.append(f"chat of {size}: {len(participants)} participants instead of {len(set(extra_ids))}")
+
+    if len(create_counts) != 1:
+        problems.append(f"create_chat statement count depends on group size: {sorted(create_counts)}")
+    if len(add_counts) != 1:
+        problems.append(f"add_participants statement count depends on group size: {sorted(add_counts)}")
+    if len(add_one_counts) != 1:
+        problems.append(f"add_participant_to_chat statement count depends on group size: {sorted(add_one_counts)}")
+    await engine.dispose()
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--check", action="store_true", help="exit with code 1 on a regression (for CI)")
+    args = parser.parse_args()
+    problems = asyncio.run(main(args.sizes))
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    if problems and args.check:
+        sys.exit(1)
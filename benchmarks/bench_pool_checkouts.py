@@ -0,0 +1,75 @@
+"""Сколько раз запрос берет подключение из пула: сессия на вызов DAO против сессии на запрос.
+
+Кэши токенов и членства сбрасываются перед каждым запросом, чтобы измерять холодный путь.
+
+Запуск:
+    python -m benchmarks.bench_pool_checkouts --requests 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DB_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.sqlite")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from app.chat.dao import ChatsDAO, MessagesDAO  # noqa: E402
+from app.chat.membership import chat_membership  # noqa: E402
+from app.database import Base, engine, pool_metrics  # noqa: E402
+from app.main import app  # noqa: E402
+from app.users.auth import create_access_token  # noqa: E402
+from app.users.dao import UsersDAO  # noqa: E402
+from app.users.token_cache import token_cache  # noqa: E402
+from benchmarks.asgi import request  # noqa: E402
+
+
+async def legacy_send_message(user_id: int, chat_id: int):
+    """Прежний путь POST /chat/messages: каждый вызов DAO в своей сессии"""
+    await UsersDAO.find_one_or_none_by_id(user_id)
+    await ChatsDAO.get_participant_ids(chat_id)
+    await MessagesDAO.add_message(chat_id=chat_id, sender_id=user_id, content="legacy")
+    await UsersDAO.find_one_or_none_by_id(user_id)
+
+
+async def measure(name: str, call, requests: int):
+    checkouts = pool_metrics.checkouts
+    started = time.perf_counter()
+    for _ in range(requests):
+        token_cache.clear()
+        chat_membership.clear()
+        await call()
+    elapsed = time.perf_counter() - started
+    checkouts = pool_metrics.checkouts - checkouts
+    print(f"  {name:<32} {checkouts / requests:5.2f} checkouts/request  {requests / elapsed:8.0f} req/s")
+
+
+async def main(requests: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    user = await UsersDAO.add(name="bench", email="bench@example.com", hashed_password="-")
+    chat = await ChatsDAO.create_chat(name="bench", participant_ids=[user.id])
+    cookies = {"users_access_token": create_access_token({"sub": str(user.id)})}
+
+    async def send_message():
+        status, _, body = await request(app, "POST", "/chat/messages", json_body={"chat_id": chat.id, "content": "hi"},
+                                        cookies=cookies)
+        assert status == 200, body
+
+    async def get_messages():
+        status, _, body = await request(app, "GET", f"/chat/messages/{chat.id}", cookies=cookies)
+        assert status == 200, body
+
+    print(f"{requests} requests per case, cold token and membership caches, {engine.url.get_backend_name()}")
+    await measure("send_message, session per call", lambda: legacy_send_message(user.id, chat.id), requests)
+    await measure("POST /chat/messages", send_message, requests)
+    await measure("GET /chat/messages/{chat_id}", get_messages, requests)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
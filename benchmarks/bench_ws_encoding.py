@@ -0,0 +1,69 @@
+"""Форматы кадров WebSocket: JSON и MessagePack — время кодирования/разбора и размер кадра.
+
+Кадры — те же события, что рассылает /chat/ws: новое сообщение, правка, досылка после переподключения.
+Размер показан как есть и после permessage-deflate (сжатие каждого кадра отдельно, без общего словаря).
+Кодирование идет один раз на событие и формат, разбор — у каждого получателя.
+
+Запуск:
+    python -m benchmarks.bench_ws_encoding --repeat 20000
+"""
+import argparse
+import os
+import timeit
+import zlib
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from app.chat.codecs import CODECS  # noqa: E402
+
+
+def message_event(i: int, content: str) -> dict:
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=i, microseconds=123456)
+    return {
+        'type': 'message',
+        'id': 1_000_000 + i,
+        'chat_id': 4321,
+        'seq': 50_000 + i,
+        'sender_id': 1234 + i % 7,
+        'sender_name': 'Анна Петрова',
+        'content': content,
+        'created_at': created_at.replace(tzinfo=None).isoformat(),
+    }
+
+
+def sample_frames() -> dict:
+    return {
+        "short message": message_event(0, "Привет! Во сколько созвон?"),
+        "long message": message_event(1, "Длинное сообщение с текстом на русском и English words. " * 20),
+        "edit": {'type': 'message_edited', 'chat_id': 4321, 'seq': 50_100, 'id': 1_000_000,
+                 'content': "Привет! Во сколько созвон завтра?", 'edited_at': '2026-01-01T00:05:00.654321'},
+        "replay x100": {'type': 'replay', 'chat_id': 4321, 'seq': 50_099,
+                        'events': [message_event(i, f"Сообщение номер {i}") for i in range(100)]},
+    }
+
+
+def deflated_size(frame) -> int:
+    data = frame.encode() if isinstance(frame, str) else frame
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def main(repeat: int):
+    print(f"{'frame':<15} {'format':<8} {'bytes':>7} {'deflate':>8} {'encode us':>10} {'decode us':>10}")
+    for name, message in sample_frames().items():
+        count = max(repeat // len(message.get('events', [None])), 100)
+        for codec in CODECS.values():
+            frame = codec.encode(message)
+            encode = timeit.timeit(lambda: codec.encode(message), number=count) / count * 1e6
+            decode = timeit.timeit(lambda: codec.decode(frame), number=count) / count * 1e6
+            print(f"{name:<15} {codec.name:<8} {len(frame):>7} {deflated_size(frame):>8} "
+                  f"{encode:>10.2f} {decode:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,68 @@
+"""Сравнение двух JSON-отчетов benchmarks.suite: изменение каждой метрики и регрессии сверх порога.
+
+Запуск:
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Код возврата 1, если хотя бы одна метрика ухудшилась больше чем на threshold процентов.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional
+
+# Метрики, для которых больше — лучше; остальные (задержки, время) — чем меньше, тем лучше
+HIGHER_IS_BETTER = ("throughput_rps", "deliveries_per_second")
+# Параметры прогона, а не результаты
+IGNORED = ("requests", "concurrency", "members", "messages", "bcrypt_rounds")
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in IGNORED:
+            metrics[name] = value
+    return metrics
+
+
+def change(name: str, before: float, after: float) -> Optional[float]:
+    """Изменение в процентах со знаком: положительное — улучшение"""
+    if not before:
+        return None
+    delta = (after - before) / before * 100
+    return delta if name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else -delta
+
+
+def main(before_path: str, after_path: str, threshold: float) -> int:
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    before_metrics, after_metrics = flatten(before["results"]), flatten(after["results"])
+
+    print(f"before: {before['meta']['git']['commit']} ({before['meta']['db_backend']})")
+    print(f"after:  {after['meta']['git']['commit']} ({after['meta']['db_backend']})")
+    regressions = 0
+    for name in sorted(before_metrics.keys() & after_metrics.keys()):
+        delta = change(name, before_metrics[name], after_metrics[name])
+        mark = ""
+        if delta is not None and delta < -threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        delta_text = f"{delta:+7.1f}%" if delta is not None else "      -"
+        print(f"  {name:<60} {before_metrics[name]:12.2f} {after_metrics[name]:12.2f} {delta_text}{mark}")
+    for name in sorted(before_metrics.keys() ^ after_metrics.keys()):
+        print(f"  {name:<60} only in {'before' if name in before_metrics else 'after'}")
+    print(f"{regressions} regression(s) over {threshold:g}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="Допустимое ухудшение, %%")
+    args = parser.parse_args()
+    sys.exit(main(args.before, args.after, args.threshold))
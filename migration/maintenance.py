@@ -0,0 +1,32 @@
+"""Тяжелые миграции: переписывают или копируют таблицу сообщений под эксклюзивной блокировкой.
+
+Контейнер при старте сам делает alembic upgrade head, и на большой базе такая миграция остановила бы
+чат на все время перезаписи. Поэтому на таблице больше MAX_ROWS_WITHOUT_WINDOW строк она не выполняется,
+пока ее явно не разрешили в окно обслуживания:
+
+    alembic -x maintenance=true upgrade head
+
+На пустой или небольшой базе (новая установка, разработка, SQLite) миграции идут как обычно.
+"""
+from alembic import context, op
+from sqlalchemy import text
+
+MAX_ROWS_WITHOUT_WINDOW = 100_000
+
+
+def require_maintenance_window(revision: str, table: str):
+    """Остановить миграцию revision, если table большая, а окно обслуживания не разрешено"""
+    # alembic upgrade --sql: SQL выполняет сам оператор, а базы у миграции нет
+    if context.is_offline_mode() or op.get_context().dialect.name != 'postgresql':
+        return
+    if context.get_x_argument(as_dictionary=True).get('maintenance') == 'true':
+        return
+    # Считаем не больше порога: count(*) по всей большой таблице сам по себе долгий
+    rows = op.get_bind().execute(text(
+        f"SELECT count(*) FROM (SELECT 1 FROM {table} LIMIT {MAX_ROWS_WITHOUT_WINDOW + 1}) AS sample"
+    )).scalar()
+    if rows > MAX_ROWS_WITHOUT_WINDOW:
+        raise RuntimeError(
+            f"Migration {revision} rewrites table {table} (more than {MAX_ROWS_WITHOUT_WINDOW} rows) under "
+            f"an exclusive lock; run it in a maintenance window: alembic -x maintenance=true upgrade head"
+        )
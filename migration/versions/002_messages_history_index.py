@@ -0,0 +1,27 @@
+"""messages_history_index
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Индекс под keyset-пагинацию истории. CONCURRENTLY не блокирует запись в messages,
+    # но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_chat_id_created_at_id', 'messages', ['chat_id', 'created_at', 'id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_chat_id_created_at_id', table_name='messages', postgresql_concurrently=True)
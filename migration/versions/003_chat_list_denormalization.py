@@ -0,0 +1,56 @@
+"""chat_list_denormalization
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Денормализованные поля списка чатов и указатель прочитанного
+    op.add_column('chats', sa.Column('last_message_id', sa.Integer(), nullable=True))
+    op.add_column('chats', sa.Column('last_message_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('chats', sa.Column('participant_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('chat_participants', sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+
+    # Заполняем по существующим данным; старую историю считаем прочитанной
+    op.execute("""
+        UPDATE chats SET
+            participant_count = (SELECT count(*) FROM chat_participants WHERE chat_participants.chat_id = chats.id),
+            last_message_id = (SELECT max(messages.id) FROM messages WHERE messages.chat_id = chats.id)
+    """)
+    op.execute("""
+        UPDATE chats SET last_message_at = (SELECT messages.created_at FROM messages WHERE messages.id = chats.last_message_id)
+        WHERE last_message_id IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE chat_participants SET last_read_message_id = (
+            SELECT chats.last_message_id FROM chats WHERE chats.id = chat_participants.chat_id
+        )
+    """)
+
+    # Индексы под список чатов пользователя и счетчик непрочитанных
+    with op.get_context().autocommit_block():
+        op.create_index('ix_chat_participants_user_id', 'chat_participants', ['user_id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_messages_chat_id_id', 'messages', ['chat_id', 'id'], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_chat_id_id', table_name='messages', postgresql_concurrently=True)
+        op.drop_index('ix_chat_participants_user_id', table_name='chat_participants', postgresql_concurrently=True)
+
+    op.drop_column('chat_participants', 'last_read_message_id')
+    op.drop_column('chats', 'participant_count')
+    op.drop_column('chats', 'last_message_at')
+    op.drop_column('chats', 'last_message_id')
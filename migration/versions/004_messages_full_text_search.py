@@ -0,0 +1,66 @@
+"""messages_full_text_search
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+from migration.maintenance import require_maintenance_window
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_context().dialect.name == 'sqlite':
+        # Локальная разработка: внешняя FTS5-таблица, которую поддерживают триггеры
+        op.execute("""
+            CREATE VIRTUAL TABLE messages_fts USING fts5(
+                content, content='messages', content_rowid='id', tokenize='unicode61'
+            )
+        """)
+        op.execute("""
+            CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        return
+
+    # Генерируемая колонка переписывает таблицу под эксклюзивной блокировкой — на большой базе
+    # миграцию нужно запускать в окно обслуживания
+    require_maintenance_window(revision, 'messages')
+    op.execute("""
+        ALTER TABLE messages ADD COLUMN content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED
+    """)
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY ix_messages_content_tsv ON messages USING gin (content_tsv)")
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER messages_fts_au")
+        op.execute("DROP TRIGGER messages_fts_ad")
+        op.execute("DROP TRIGGER messages_fts_ai")
+        op.execute("DROP TABLE messages_fts")
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY ix_messages_content_tsv")
+    op.execute("ALTER TABLE messages DROP COLUMN content_tsv")
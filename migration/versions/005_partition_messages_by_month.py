@@ -0,0 +1,123 @@
+"""partition_messages_by_month
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+from migration.maintenance import require_maintenance_window
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+# Партиции от месяца самого старого сообщения до текущего плюс три вперед; дальше их создает приложение
+# (app/chat/partitions.py). Имена и границы — те же, что там: messages_yYYYYmMM, полночь первого числа по UTC
+CREATE_MONTHLY_PARTITIONS = """
+    DO $$
+    DECLARE
+        month date := date_trunc('month', coalesce(
+            (SELECT min(created_at) FROM messages_unpartitioned), now()) AT TIME ZONE 'UTC')::date;
+        last_month date := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date;
+    BEGIN
+        WHILE month <= last_month LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                'messages_' || to_char(month, '"y"YYYY"m"MM'),
+                month::text || ' 00:00:00+00',
+                (month + interval '1 month')::date::text || ' 00:00:00+00'
+            );
+            month := (month + interval '1 month')::date;
+        END LOOP;
+    END
+    $$
+"""
+
+CREATE_INDEXES = [
+    "CREATE INDEX ix_messages_chat_id_created_at_id ON messages (chat_id, created_at, id)",
+    "CREATE INDEX ix_messages_chat_id_id ON messages (chat_id, id)",
+    "CREATE INDEX ix_messages_content_tsv ON messages USING gin (content_tsv)",
+]
+
+DROP_INDEXES = [
+    "DROP INDEX IF EXISTS ix_messages_id",
+    "DROP INDEX IF EXISTS ix_messages_chat_id_created_at_id",
+    "DROP INDEX IF EXISTS ix_messages_chat_id_id",
+    "DROP INDEX IF EXISTS ix_messages_content_tsv",
+]
+
+
+def upgrade():
+    # Партиционирование есть только в Postgres; в SQLite (локальная разработка) таблица остается обычной
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    # Таблица переписывается целиком под эксклюзивной блокировкой — на большой базе только в окно обслуживания
+    require_maintenance_window(revision, 'messages')
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey")
+    # Имена индексов глобальны в схеме; копировать данные без индексов еще и быстрее
+    for statement in DROP_INDEXES:
+        op.execute(statement)
+
+    # Ключ партиционирования обязан входить в первичный ключ; уникальность id по-прежнему дает последовательность
+    op.execute("""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+            chat_id integer REFERENCES chats (id),
+            sender_id integer REFERENCES users (id),
+            content text,
+            created_at timestamp with time zone NOT NULL DEFAULT now(),
+            updated_at timestamp with time zone DEFAULT now(),
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    # Страховка на случай, если партиции наперед не созданы: строки не теряются, но их придется переносить
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+
+    op.execute("""
+        INSERT INTO messages (id, chat_id, sender_id, content, created_at, updated_at)
+        SELECT id, chat_id, sender_id, content, coalesce(created_at, updated_at, now()), updated_at
+        FROM messages_unpartitioned
+    """)
+    op.execute("DROP TABLE messages_unpartitioned")
+    for statement in CREATE_INDEXES:
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+
+    require_maintenance_window(revision, 'messages')
+    # Сообщения, уже перенесенные в архивные сегменты, в БД не возвращаются
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey")
+    for statement in DROP_INDEXES:
+        op.execute(statement)
+    op.execute("""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+            chat_id integer REFERENCES chats (id),
+            sender_id integer REFERENCES users (id),
+            content text,
+            created_at timestamp with time zone DEFAULT now(),
+            updated_at timestamp with time zone DEFAULT now(),
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED,
+            CONSTRAINT messages_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute("""
+        INSERT INTO messages (id, chat_id, sender_id, content, created_at, updated_at)
+        SELECT id, chat_id, sender_id, content, created_at, updated_at FROM messages_partitioned
+    """)
+    op.execute("DROP TABLE messages_partitioned")
+    for statement in CREATE_INDEXES:
+        op.execute(statement)
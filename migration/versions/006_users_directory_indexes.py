@@ -0,0 +1,38 @@
+"""users_directory_indexes
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Справочник пользователей: префиксный поиск и сортировка по lower(name)/lower(email), id.
+    # В Postgres — побайтовый порядок (COLLATE "C"), см. app/users/directory.py
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute('CREATE INDEX CONCURRENTLY ix_users_lower_name ON users ((lower(name) COLLATE "C"), id)')
+            op.execute('CREATE INDEX CONCURRENTLY ix_users_lower_email ON users ((lower(email) COLLATE "C"), id)')
+        return
+
+    op.execute("CREATE INDEX ix_users_lower_name ON users (lower(name), id)")
+    op.execute("CREATE INDEX ix_users_lower_email ON users (lower(email), id)")
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY ix_users_lower_email")
+            op.execute("DROP INDEX CONCURRENTLY ix_users_lower_name")
+        return
+
+    op.execute("DROP INDEX ix_users_lower_email")
+    op.execute("DROP INDEX ix_users_lower_name")
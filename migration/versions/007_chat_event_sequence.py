@@ -0,0 +1,57 @@
+"""chat_event_sequence
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from migration.maintenance import require_maintenance_window
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Нумерация существующей истории обновляет каждую строку сообщений
+    require_maintenance_window(revision, 'messages')
+
+    # Номера событий чата: последний выданный — в чате, у сообщения — его собственный
+    op.add_column('chats', sa.Column('last_seq', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('seq', sa.Integer(), nullable=True))
+
+    # Журнал остальных событий чата: правки, удаления, вход участников
+    op.create_table(
+        'chat_events',
+        sa.Column('chat_id', sa.Integer(), sa.ForeignKey('chats.id'), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('type', sa.Text(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('chat_id', 'seq')
+    )
+
+    # Существующая история нумеруется по порядку сообщений
+    op.execute("""
+        UPDATE messages SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_id ORDER BY created_at, id) AS seq FROM messages
+        ) AS numbered
+        WHERE messages.id = numbered.id
+    """)
+    op.execute("UPDATE chats SET last_seq = coalesce((SELECT max(seq) FROM messages WHERE messages.chat_id = chats.id), 0)")
+
+    # Индекс на партиционированной таблице (Postgres) CONCURRENTLY не строится
+    op.create_index('ix_messages_chat_id_seq', 'messages', ['chat_id', 'seq'])
+
+
+def downgrade():
+    op.drop_index('ix_messages_chat_id_seq', table_name='messages')
+    op.drop_table('chat_events')
+    op.drop_column('messages', 'seq')
+    op.drop_column('chats', 'last_seq')
@@ -0,0 +1,35 @@
+"""client_message_ids
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Клиентские ID сообщений для идемпотентной пакетной отправки по WebSocket
+    op.create_table(
+        'client_messages',
+        sa.Column('sender_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('client_id', sa.Text(), nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('sender_id', 'client_id')
+    )
+    op.create_index('ix_client_messages_created_at', 'client_messages', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_client_messages_created_at', table_name='client_messages')
+    op.drop_table('client_messages')